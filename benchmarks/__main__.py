@@ -0,0 +1,242 @@
+"""
+Scraper benchmarks, run against a local stand-in for UKC serving a synthetic guidebook (see tests/corpus.py)
+
+    hatch run bench [--check] [--save-baseline]
+
+Each benchmark reports its best time over --repeat runs, its throughput and its peak traced memory, and how these
+compare with benchmarks/baseline.json. Memory is measured in a separate run with tracemalloc, so tracing doesn't
+slow the timed runs.
+"""
+import click
+import json
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+
+from click.testing import CliRunner
+from contextlib import contextmanager
+from pathlib import Path
+
+from scrape.cli import main as scrape_main
+from scrape.grade_poll import get_poll_grade, get_poll_grades, poll_matrix
+from scrape.limiter import AdaptiveRateLimiter
+from scrape.scrape import Scraper
+from tests.corpus import SyntheticCorpus
+from tests.server import UKCServer
+
+BASELINE_FILE = Path(__file__).parent / 'baseline.json'
+
+# The guidebook the CLI scrapes for --area, any guidebook url not saved in tests/data/ukc is the synthetic guidebook
+CLI_AREA = 'dorset'
+GUIDEBOOK_PATH = '/logbook/books/bench-1/'
+
+# Fast enough that the rate limit doesn't affect the timings, and kept there when the server returns errors
+UNLIMITED_RATE = 1e6
+
+
+@contextmanager
+def working_dir(path):
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+class Benchmarks:
+    """
+    Benchmarks for one corpus. Each benchmark returns a function to time, that returns the number of items it
+    processed, and the items' unit
+    """
+
+    def __init__(self, server: UKCServer, data_dir: str):
+        self.server = server
+        self.data_dir = data_dir
+
+        # Warm the request cache so that the page scrapers measure the cache and parsing, not the server
+        self.scraper = self._scraper(data_dir)
+        self.crags = self.scraper.scrape_guidebook_and_contents(self.guidebook_url)
+        self.crag_urls = [crag.url for crag in self.crags]
+        self.climb_urls = [climb.url for crag in self.crags for climb in crag.climbs]
+        self.polls = [self.scraper.scrape_grade_poll(url, refresh=False) for url in self.climb_urls]
+
+    @property
+    def guidebook_url(self):
+        return self.server.url + GUIDEBOOK_PATH
+
+    @staticmethod
+    def _scraper(data_dir):
+        limiter = AdaptiveRateLimiter(rate=UNLIMITED_RATE, min_rate=UNLIMITED_RATE, max_rate=UNLIMITED_RATE)
+        return Scraper(data_dir=data_dir, limiter=limiter)
+
+    def scrape_guidebook(self):
+        def run():
+            self.scraper.scrape_guidebook(self.guidebook_url, refresh=False)
+            return 1
+        return run, 'pages'
+
+    def scrape_crag(self):
+        def run():
+            for url in self.crag_urls:
+                self.scraper.scrape_crag(url, refresh=False)
+            return len(self.crag_urls)
+        return run, 'pages'
+
+    def scrape_grade_poll(self):
+        def run():
+            for url in self.climb_urls:
+                self.scraper.scrape_grade_poll(url, refresh=False)
+            return len(self.climb_urls)
+        return run, 'pages'
+
+    def get_poll_grade(self):
+        def run():
+            for poll_data in self.polls:
+                get_poll_grade(poll_data)
+            return len(self.polls)
+        return run, 'polls'
+
+    def get_poll_grades(self):
+        def run():
+            get_poll_grades(*poll_matrix(self.polls))
+            return len(self.polls)
+        return run, 'polls'
+
+    def write_climbs_csv(self):
+        def run():
+            self.scraper.write_climbs_csv(self.crags, 'bench.csv')
+            return len(self.climb_urls)
+        return run, 'climbs'
+
+    def cli(self):
+        """The whole scrape from an empty cache, every page is downloaded from the local server"""
+        def run():
+            with tempfile.TemporaryDirectory() as cwd:
+                self._run_cli(cwd)
+            return len(self.climb_urls)
+        return run, 'climbs'
+
+    def cli_offline(self):
+        """The whole scrape again, with every page from the cache"""
+        cwd = tempfile.mkdtemp(dir=self.data_dir)
+        self._run_cli(cwd)
+
+        def run():
+            self._run_cli(cwd, '--offline')
+            return len(self.climb_urls)
+        return run, 'climbs'
+
+    def _run_cli(self, cwd, *args):
+        with working_dir(cwd):
+            rate = str(UNLIMITED_RATE)
+            result = CliRunner().invoke(scrape_main, ['--area', CLI_AREA, '--base-url', self.server.url,
+                                                      '--rate', rate, '--min-rate', rate, '--max-rate', rate, *args])
+        if result.exit_code != 0:
+            raise RuntimeError(f'Scrape failed: {result.output}') from result.exception
+
+
+BENCHMARKS = ['scrape_guidebook', 'scrape_crag', 'scrape_grade_poll', 'get_poll_grade', 'get_poll_grades',
+              'write_climbs_csv', 'cli', 'cli_offline']
+
+
+def measure(benchmarks: Benchmarks, name: str, repeat: int) -> dict:
+    """Return the best time of repeat runs of a benchmark, its throughput and the peak memory of one more run"""
+    run, unit = getattr(benchmarks, name)()
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        n_items = run()
+        seconds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    best = min(seconds)
+    return {'seconds': best, 'throughput': n_items / best, 'unit': f'{unit}/s', 'peak_mb': peak / 2 ** 20}
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Return the ways a result is worse than its baseline by more than tolerance (a fraction)"""
+    regressions = []
+    for key in ['seconds', 'peak_mb']:
+        if baseline and result[key] > baseline[key] * (1 + tolerance):
+            regressions.append(f'{key} {result[key]:.4g} > {baseline[key]:.4g}')
+    return regressions
+
+
+def change(value, baseline_value):
+    return f'{value / baseline_value - 1:+.0%}' if baseline_value else ''
+
+
+@click.command(context_settings={'help_option_names': ['-h', '--help']})
+@click.option('--crags', 'n_crags', default=20, show_default=True, type=click.IntRange(min=1),
+              help='Number of crags in the synthetic guidebook')
+@click.option('--climbs', 'n_climbs', default=25, show_default=True, type=click.IntRange(min=1),
+              help='Number of climbs on each crag')
+@click.option('--repeat', '-r', default=5, show_default=True, type=click.IntRange(min=1),
+              help='Number of timed runs of each benchmark, the best is reported')
+@click.option('--latency', default=0.0, show_default=True, type=click.FloatRange(min=0),
+              help='Seconds the server waits before answering each request')
+@click.option('--error-rate', default=0.0, show_default=True, type=click.FloatRange(min=0, max=1, max_open=True),
+              help='Fraction of requests the server answers with 503')
+@click.option('--benchmark', '-k', 'names', multiple=True, type=click.Choice(BENCHMARKS),
+              help='Benchmark to run, repeat for several, all by default')
+@click.option('--baseline', 'baseline_file', default=str(BASELINE_FILE), show_default=True,
+              type=click.Path(dir_okay=False), help='Baseline results to compare with')
+@click.option('--save-baseline', is_flag=True, help='Save the results as the new baseline')
+@click.option('--tolerance', default=0.2, show_default=True, type=click.FloatRange(min=0),
+              help='Fraction a time or peak memory may exceed its baseline by before --check fails')
+@click.option('--check', is_flag=True, help='Exit with an error if any benchmark regressed from the baseline')
+def main(n_crags, n_climbs, repeat, latency, error_rate, names, baseline_file, save_baseline, tolerance, check):
+    logging.getLogger().setLevel(logging.ERROR)
+    names = names or BENCHMARKS
+    corpus = SyntheticCorpus(n_crags=n_crags, n_climbs=n_climbs)
+    config = {'crags': n_crags, 'climbs': n_climbs, 'latency': latency, 'error_rate': error_rate}
+
+    baseline = {}
+    if os.path.exists(baseline_file):
+        with open(baseline_file) as f:
+            saved = json.load(f)
+        if saved['config'] == config:
+            baseline = saved['results']
+        else:
+            click.echo(f'Baseline {baseline_file} is for {saved["config"]}, not comparing', err=True)
+
+    results = {}
+    regressions = {}
+    with UKCServer(latency=latency, error_rate=error_rate, corpus=corpus) as server, \
+            tempfile.TemporaryDirectory() as data_dir:
+        benchmarks = Benchmarks(server, data_dir)
+        click.echo(f'{"benchmark":<18} {"time (ms)":>10} {"vs base":>8} {"throughput":>18} {"peak (MB)":>10} '
+                   f'{"vs base":>8}')
+        for name in names:
+            result = results[name] = measure(benchmarks, name, repeat)
+            base = baseline.get(name, {})
+            regressions[name] = compare(result, base, tolerance)
+            click.echo(f'{name:<18} {result["seconds"] * 1000:>10.1f} '
+                       f'{change(result["seconds"], base.get("seconds")):>8} '
+                       f'{result["throughput"]:>10.0f} {result["unit"]:<7} {result["peak_mb"]:>10.2f} '
+                       f'{change(result["peak_mb"], base.get("peak_mb")):>8}'
+                       f'{"  REGRESSED" if regressions[name] else ""}')
+
+    if save_baseline:
+        # Benchmarks that weren't run keep their baseline, unless it was for another config
+        with open(baseline_file, 'w') as f:
+            json.dump({'config': config, 'results': {**baseline, **results}}, f, indent=2)
+        click.echo(f'Baseline saved to {baseline_file}')
+
+    regressed = {name: reasons for name, reasons in regressions.items() if reasons}
+    if check and regressed:
+        raise click.ClickException('Regressed from the baseline: ' +
+                                   '; '.join(f'{name} ({", ".join(reasons)})' for name, reasons in regressed.items()))
+
+
+if __name__ == '__main__':
+    main()
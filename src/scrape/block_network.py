@@ -1,5 +1,7 @@
 import socket
 
+from contextlib import contextmanager
+
 
 class BlockNetwork(socket.socket):
     def __init__(self, *args, **kwargs):
@@ -7,5 +9,12 @@ class BlockNetwork(socket.socket):
         raise Exception('Network call blocked')
 
 
-# Test if cache is being used by blocking network
-socket.socket = BlockNetwork
+@contextmanager
+def block_network():
+    """Make any network call raise while in the context, to check that pages are only served from the cache"""
+    original_socket = socket.socket
+    socket.socket = BlockNetwork
+    try:
+        yield
+    finally:
+        socket.socket = original_socket
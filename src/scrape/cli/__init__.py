@@ -2,13 +2,28 @@
 #
 # SPDX-License-Identifier: MIT
 import click
+import cProfile
 import logging
+import os
+import pstats
+import sys
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import timedelta
+from urllib.parse import urlsplit, urlunsplit
 
 from starchaser.__about__ import __version__
-from starchaser.utils import GuidebookInfo
+from starchaser.datastore import SqliteClimbStore
+from starchaser.utils import GuidebookInfo, read_climbs
+from scrape.block_network import block_network
+from scrape.journal import Journal
+from scrape.limiter import AdaptiveRateLimiter
+from scrape.output import OUTPUT_FORMATS
 from scrape.scrape import Scraper
 
+PROFILE_FILE = 'scrape-profile.prof'
+PROFILE_TOP_N = 30  # Functions printed from the profile, by cumulative time
 
 logger = logging.getLogger()
 handler = logging.StreamHandler()
@@ -18,13 +33,157 @@ logger.setLevel(logging.INFO)
 
 
 @click.command(context_settings={'help_option_names': ['-h', '--help']})
-@click.option('--area', '-a',
-              default='dorset', show_default=True,
-              type=click.Choice(GuidebookInfo.get_area_names()))
+@click.option('--area', '-a', 'areas',
+              default=['dorset'], show_default=True, multiple=True,
+              type=click.Choice(GuidebookInfo.get_area_names() + ['all']),
+              help='Area to scrape, repeat to scrape several areas at once or use "all"')
+@click.option('--concurrency', '-j',
+              default=1, show_default=True,
+              type=click.IntRange(min=1),
+              help='Number of page requests in flight at once per area (still subject to the rate limit)')
+@click.option('--parse-workers', '-p',
+              default=1, show_default=True,
+              type=click.IntRange(min=0),
+              help='Number of processes used to parse pages, 0 for one per CPU core')
+@click.option('--revalidate', is_flag=True,
+              help='Check every cached page is up-to-date with a conditional request, not just expired pages')
+@click.option('--incremental', is_flag=True,
+              help='Only scrape grade polls for climbs that are new or changed since the previous run')
+@click.option('--rate',
+              default=5.0, show_default=True,
+              type=click.FloatRange(min=0, min_open=True),
+              help='Initial request rate limit (requests/sec), adjusted to how fast the server responds')
+@click.option('--min-rate',
+              default=0.5, show_default=True,
+              type=click.FloatRange(min=0, min_open=True),
+              help='Lowest the request rate limit backs off to (requests/sec)')
+@click.option('--max-rate',
+              default=10.0, show_default=True,
+              type=click.FloatRange(min=0, min_open=True),
+              help='Highest the request rate limit rises to (requests/sec)')
+@click.option('--retries',
+              default=3, show_default=True,
+              type=click.IntRange(min=0),
+              help='Number of times a failed or throttled (429/503) request is retried')
+@click.option('--grade-type', '-g', 'grade_types',
+              default=['sport'], show_default=True, multiple=True,
+              help='Grade type of the climbs to scrape, by name (e.g. sport, trad) or UKC id, repeat for several')
+@click.option('--format', '-f', 'fmt',
+              default='csv', show_default=True,
+              type=click.Choice(OUTPUT_FORMATS),
+              help='Output file format, parquet and feather keep column types and can be read a column at a time')
+@click.option('--db',
+              type=click.Path(dir_okay=False),
+              help='SQLite database for the dashboard to read climbs from, the climbs of each area scraped replace '
+                   'those already in it')
+@click.option('--offline', is_flag=True,
+              help='Only use pages already in the request cache, expired or not, and block all network calls')
+@click.option('--base-url',
+              help='Scrape from this server instead of UKC, e.g. a local stand-in such as http://127.0.0.1:8000')
+@click.option('--report',
+              default='scrape-report.json', show_default=True,
+              help='File in the data directory to write the run report to, as JSON')
+@click.option('--profile', is_flag=True,
+              help='Profile the scrape with cProfile, saving the stats to scrape-profile.prof in the data directory')
 @click.version_option(version=__version__, prog_name='Starchaser Scraper')
-def main(area):
-    s = Scraper()
-    crag_data = s.scrape_guidebook_and_contents(GuidebookInfo.get_url(area))
-    out_file = f'{area}.csv'
-    s.write_climbs_csv(crag_data, out_file)
+def main(areas, concurrency, parse_workers, revalidate, incremental, rate, min_rate, max_rate, retries, grade_types,
+         fmt, db, offline, base_url, report, profile):
+    if 'all' in areas:
+        areas = GuidebookInfo.get_area_names()
+    areas = list(dict.fromkeys(areas))
+
+    # Areas are scraped at the same time so that their requests interleave,
+    # sharing one session and so one cache and rate limit
+    try:
+        limiter = AdaptiveRateLimiter(rate=rate, min_rate=min_rate, max_rate=max_rate)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+    s = Scraper(concurrency=concurrency, parse_workers=parse_workers, revalidate=revalidate, limiter=limiter,
+                retries=retries, grade_types=grade_types, offline=offline)
+    if s.grades.grade_type_list:
+        # Otherwise the grade types are checked once the first crag page lists them
+        try:
+            s.grades.gradetype_ids(grade_types)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='--grade-type')
+    profiler = cProfile.Profile() if profile else None
+    try:
+        with block_network() if offline else nullcontext():
+            scrape_areas(s, areas, incremental, fmt, base_url, profiler)
+    finally:
+        s.close()
+
+    if db:
+        store = SqliteClimbStore(db)
+        for area in areas:
+            store.write_area(area, read_climbs(os.path.join(s.data_dir, f'{area}.{fmt}')))
+            logger.info(f'{area} written to {db}')
+
+    s.log_stats()
+    s.write_report(report, areas=areas, format=fmt, concurrency=concurrency, parse_workers=parse_workers,
+                   offline=offline, revalidate=revalidate, incremental=incremental)
+    if profiler is not None:
+        profile_path = os.path.join(s.data_dir, PROFILE_FILE)
+        profiler.dump_stats(profile_path)
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(PROFILE_TOP_N)
+        logger.info(f'Profile written to {profile_path}')
+
+
+def scrape_areas(s, areas, incremental, fmt, base_url=None, profiler=None):
+    """
+    Scrape areas at the same time, so that their requests interleave. cProfile only sees the thread it's enabled in,
+    so with a profiler areas are scraped one after another in this thread. Fetches with concurrency > 1 and parse
+    workers still run in other threads and processes, and show in the profile as time waiting for them.
+    """
+    if profiler is not None:
+        for area in areas:
+            profiler.runcall(scrape_area, s, area, incremental, fmt, base_url)
+        return
+
+    with ThreadPoolExecutor(max_workers=len(areas)) as executor:
+        futures = [executor.submit(scrape_area, s, area, incremental, fmt, base_url) for area in areas]
+    for future in futures:
+        future.result()
+
+
+def guidebook_url(area, base_url=None):
+    """Return the url of an area's guidebook, on the server at base_url if given"""
+    url = GuidebookInfo.get_url(area)
+    if base_url is None:
+        return url
+    base_parts = urlsplit(base_url)
+    return urlunsplit(urlsplit(url)._replace(scheme=base_parts.scheme, netloc=base_parts.netloc))
 
+
+def scrape_area(s, area, incremental, fmt='csv', base_url=None):
+    state_file = f'{area}-state.json'
+    previous_state = s.read_climb_state(state_file) if incremental else None
+
+    # The journal is only removed once the output is written, so an interrupted run resumes where it left off
+    journal = Journal(os.path.join(s.data_dir, f'{area}-journal.jsonl'))
+
+    # Each crag is written out and freed as soon as it is finished, only its climb state is kept
+    state = dict()
+
+    def crags_with_state():
+        for crag in s.iter_guidebook_and_contents(guidebook_url(area, base_url), previous_state=previous_state,
+                                                  journal=journal):
+            state.update(s.get_climb_state(crag))
+            yield crag
+
+    out_file = f'{area}.{fmt}'
+    s.write_climbs(crags_with_state(), out_file, fmt)
+    s.write_climb_state(state, state_file)
+    journal.remove()
+
+
+@click.command(context_settings={'help_option_names': ['-h', '--help']})
+@click.option('--older-than',
+              type=click.IntRange(min=0),
+              help='Also delete responses cached more than this many days ago')
+@click.version_option(version=__version__, prog_name='Starchaser Scraper')
+def prune_cache(older_than):
+    """Delete expired responses from the request cache and vacuum it"""
+    s = Scraper()
+    s.prune_cache(timedelta(days=older_than) if older_than is not None else None)
@@ -1,3 +1,8 @@
+import numpy as np
+
+from itertools import chain
+
+
 def get_poll_grade(poll_data):
     """
        poll_data: {
@@ -37,3 +42,67 @@ def get_poll_grade(poll_data):
     grade_code = grade_code_full.removesuffix('easy').removesuffix('hard')  # e.g. 36
 
     return grade_text, grade_code, grade_modifier
+
+
+def parse_poll_key(poll_key):
+    """Split a poll key e.g. '36easy,Low 6b' into its grade text, grade code and score modifier, like get_poll_grade"""
+    grade_code_full, grade_text = poll_key.split(',')[0], poll_key.split(',')[-1]
+    grade_modifier = 0.33 if 'easy' in grade_code_full or 'hard' in grade_code_full else 0.00
+    return grade_text, grade_code_full.removesuffix('easy').removesuffix('hard'), grade_modifier
+
+
+def poll_matrix(polls):
+    """
+    Align a list of polls (poll_data dicts as taken by get_poll_grade) by position, the axis the weighted mean index
+    is taken over. Returns an (n_polls, width) matrix of votes and a matching matrix of poll keys, with shorter polls
+    padded with no votes on the right.
+    """
+    lengths = np.fromiter(map(len, polls), dtype=np.int64, count=len(polls))
+    width = lengths.max(initial=0)
+    rows = np.repeat(np.arange(len(polls)), lengths)
+    columns = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    votes = np.zeros((len(polls), width), dtype=np.int64)
+    votes[rows, columns] = np.fromiter(chain.from_iterable(poll_data.values() for poll_data in polls),
+                                       dtype=np.int64, count=lengths.sum())
+    keys = np.full((len(polls), width), '', dtype=object)
+    keys[rows, columns] = list(chain.from_iterable(polls))
+    return votes, keys
+
+
+def get_poll_grades(votes, keys):
+    """
+    Batch version of get_poll_grade for the rows of matrices from poll_matrix. Returns arrays of the grade text,
+    grade code and score modifier of each poll, the same as get_poll_grade would for each poll on its own.
+    """
+    n_polls, width = votes.shape
+    total_votes = votes.sum(axis=1)
+    index_x_votes = votes @ np.arange(1, width + 1)
+    has_votes = total_votes > 0
+
+    grade_text = np.full(n_polls, 'No votes', dtype=object)
+    grade_code = np.full(n_polls, 'No votes', dtype=object)
+    grade_modifier = np.zeros(n_polls)
+    if has_votes.any():
+        # np.rint rounds halves to even, like round()
+        weighted_mean_index = np.rint(index_x_votes[has_votes] / total_votes[has_votes]).astype(np.int64) - 1
+        poll_keys = keys[has_votes][np.arange(len(weighted_mean_index)), weighted_mean_index]
+
+        # Each distinct poll key is only split once
+        unique_keys, inverse = np.unique(poll_keys.astype(str), return_inverse=True)
+        unique_text, unique_code, unique_modifier = zip(*map(parse_poll_key, unique_keys.tolist()))
+        grade_text[has_votes] = np.array(unique_text, dtype=object)[inverse]
+        grade_code[has_votes] = np.array(unique_code, dtype=object)[inverse]
+        grade_modifier[has_votes] = np.array(unique_modifier)[inverse]
+
+    return grade_text, grade_code, grade_modifier
+
+
+def get_poll_diffs(guidebook_scores, poll_scores, grade_modifiers):
+    """
+    How much harder the guidebook grade is than the poll grade, for arrays of grade scores. A poll score of NaN means
+    the poll grade isn't a grade of the climb's grade type (e.g. 'No votes') and gives a poll_diff of -0.01.
+    """
+    poll_scores = np.asarray(poll_scores, dtype=float)
+    return np.where(np.isnan(poll_scores), -0.01,
+                    np.asarray(guidebook_scores) - (poll_scores + np.asarray(grade_modifiers)))
@@ -0,0 +1,129 @@
+import json
+import logging
+import numpy as np
+import os
+
+from threading import Lock
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+# Grade types that are known even if no crag page has listed them yet, by lowercase name
+DEFAULT_GRADETYPES = {'sport': 3}
+
+
+class GradeIndex:
+    """
+    Every grade of every grade type, merged from the grade_list on each crag page (which all repeat the same grades)
+    into arrays indexed by [gradetype, code], so that looking up grades is integer indexing rather than a dict walk.
+
+    grade_list is {gradetype: {code: {'name': '6b', 'score': 12}, ...}, ...} with string keys, as on the crag page,
+    and grade_type_list is {gradetype: {'name': 'Sport'}, ...}
+    """
+
+    def __init__(self, grade_list: dict = None, grade_type_list: dict = None):
+        self.grade_list = dict()
+        self.grade_type_list = dict()
+        self.lock = Lock()
+        self.changed = False
+        # (scores, names), replaced as a whole so that a lookup that reads it once sees arrays of the same shape
+        self.arrays = (np.full((0, 0), np.nan), np.full((0, 0), None, dtype=object))
+        if grade_list:
+            self.add(grade_list, grade_type_list)
+        self.changed = False
+
+    def add(self, grade_list: dict, grade_type_list: dict = None) -> None:
+        """Merge a crag's grade_list. A grade that disagrees with one already in the index, e.g. because UKC has renamed
+        it since the index was saved, replaces it with a warning"""
+        with self.lock:
+            added = False
+            for gradetype, grades in grade_list.items():
+                known = self.grade_list.setdefault(gradetype, dict())
+                if known == grades:
+                    continue
+
+                for code, grade in grades.items():
+                    if code in known and known[code] != grade:
+                        logger.warning(f'Grade {gradetype}/{code} changed from {known[code]} to {grade}')
+                    if known.get(code) != grade:
+                        known[code] = grade
+                        added = True
+
+            for gradetype, grade_type in (grade_type_list or {}).items():
+                if self.grade_type_list.get(gradetype) != grade_type:
+                    self.grade_type_list[gradetype] = grade_type
+                    added = True
+
+            if added:
+                self._build()
+                self.changed = True
+
+    def _build(self):
+        n_types = max(map(int, self.grade_list), default=-1) + 1
+        n_codes = max((int(code) for grades in self.grade_list.values() for code in grades), default=-1) + 1
+        scores = np.full((n_types, n_codes), np.nan)
+        names = np.full((n_types, n_codes), None, dtype=object)
+        for gradetype, grades in self.grade_list.items():
+            for code, grade in grades.items():
+                scores[int(gradetype), int(code)] = grade['score']
+                names[int(gradetype), int(code)] = grade['name']
+
+        self.arrays = scores, names
+
+    @staticmethod
+    def _positions(shape, gradetypes, codes):
+        """Index arrays for gradetypes and codes, and a mask of those in arrays of shape"""
+        gradetypes = np.asarray(gradetypes, dtype=np.int64)
+        codes = np.asarray(codes, dtype=np.int64)
+        n_types, n_codes = shape
+        known = (gradetypes >= 0) & (gradetypes < n_types) & (codes >= 0) & (codes < n_codes)
+        return np.where(known, gradetypes, 0), np.where(known, codes, 0), known
+
+    def lookup_scores(self, gradetypes, codes) -> np.ndarray:
+        """Scores of the grades (gradetype, code), NaN for grades not in the index"""
+        scores, _ = self.arrays
+        if not scores.size:
+            return np.full(np.shape(codes), np.nan)
+        gradetypes, codes, known = self._positions(scores.shape, gradetypes, codes)
+        return np.where(known, scores[gradetypes, codes], np.nan)
+
+    def lookup_names(self, gradetypes, codes) -> np.ndarray:
+        """Names of the grades (gradetype, code), None for grades not in the index"""
+        _, names = self.arrays
+        if not names.size:
+            return np.full(np.shape(codes), None, dtype=object)
+        gradetypes, codes, known = self._positions(names.shape, gradetypes, codes)
+        return np.where(known, names[gradetypes, codes], None)
+
+    def gradetype_ids(self, grade_types: Iterable[str]) -> set:
+        """
+        Ids of grade types given by id (e.g. '3') or by name (e.g. 'sport', any case). Names are looked up in the grade
+        types from the crag pages, then DEFAULT_GRADETYPES. Raises ValueError for a name that isn't found.
+        """
+        names = dict(DEFAULT_GRADETYPES)
+        names.update({grade_type['name'].lower(): int(gradetype)
+                      for gradetype, grade_type in self.grade_type_list.items()})
+        unknown = [grade_type for grade_type in grade_types
+                   if not str(grade_type).isdigit() and str(grade_type).lower() not in names]
+        if unknown:
+            raise ValueError(f'Unknown grade types {unknown}, expected an id or one of {sorted(names)}')
+        return {int(grade_type) if str(grade_type).isdigit() else names[str(grade_type).lower()]
+                for grade_type in grade_types}
+
+    @classmethod
+    def load(cls, path: str) -> 'GradeIndex':
+        """Load an index saved by save, or return an empty index if there isn't one"""
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data['grade_list'], data['grade_type_list'])
+
+    def save(self, path: str) -> None:
+        with self.lock:
+            data = {'grade_list': self.grade_list, 'grade_type_list': self.grade_type_list}
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+            self.changed = False
@@ -0,0 +1,77 @@
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class Journal:
+    """
+    Append-only record of the crags and climbs finished by a scrape, one JSON object per line, so that an interrupted
+    scrape can be resumed without redoing finished work. Records from an earlier, unfinished run are read on opening.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.crags = dict()  # Crag url => crag data from scrape.parse.parse_crag
+        self.climbs = dict()  # Climb url => grade poll data from scrape.parse.parse_grade_poll
+
+        if os.path.exists(path):
+            self._read()
+            logger.info(f'Resuming from journal {path}: '
+                        f'{len(self.crags)} crags and {len(self.climbs)} climbs already done')
+
+        self.lock = threading.Lock()
+        self.file = open(path, 'a')
+
+    def _read(self):
+        """Read the records, and end the journal with a newline so that new records start on their own line"""
+        with open(self.path, 'rb') as f:
+            content = f.read()
+
+        # The last line is incomplete if the run was killed while writing it
+        complete, _, tail = content.rpartition(b'\n')
+        for line in complete.splitlines():
+            self._add_record(line)
+
+        if tail.strip() and self._add_record(tail):
+            with open(self.path, 'ab') as f:
+                f.write(b'\n')
+        elif tail:
+            with open(self.path, 'r+b') as f:
+                f.truncate(len(content) - len(tail))
+
+    def _add_record(self, line: bytes) -> bool:
+        """Add a record read from the journal, returning False if it's incomplete"""
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            logger.warning(f'Ignoring incomplete journal record in {self.path}')
+            return False
+
+        if record['type'] == 'crag':
+            self.crags[record['url']] = record['data']
+        elif record['type'] == 'poll':
+            self.climbs[record['url']] = record['data']
+        return True
+
+    def add_crag(self, url: str, crag_data: dict) -> None:
+        self._append({'type': 'crag', 'url': url, 'data': crag_data})
+
+    def add_climb(self, url: str, poll_data: dict) -> None:
+        self._append({'type': 'poll', 'url': url, 'data': poll_data})
+
+    def _append(self, record):
+        line = json.dumps(record) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+    def remove(self) -> None:
+        """Close and delete the journal, once the scrape it records has finished and its output has been written"""
+        self.close()
+        os.remove(self.path)
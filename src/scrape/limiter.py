@@ -0,0 +1,150 @@
+import logging
+import random
+import threading
+import time
+
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from requests.exceptions import ConnectionError, Timeout
+
+logger = logging.getLogger(__name__)
+
+# Responses that mean the server is overloaded or is throttling us
+BACKOFF_STATUSES = (429, 503)
+
+
+class AdaptiveRateLimiter:
+    """
+    Thread-safe rate limiter that adapts to the server with AIMD (additive increase, multiplicative decrease).
+
+    While responses are fast the rate increases by `increase` requests/sec for every second of requests. After a
+    429/503, a failed request or a response slower than `slow_latency`, the rate is multiplied by `decrease`.
+    The rate always stays within [min_rate, max_rate].
+    """
+
+    def __init__(self, rate: float = 5, min_rate: float = 0.5, max_rate: float = 10, increase: float = 0.5,
+                 decrease: float = 0.5, slow_latency: float = 2.0):
+        if not 0 < min_rate <= rate <= max_rate:
+            raise ValueError(f'Rate limits must satisfy 0 < min_rate ({min_rate}) <= rate ({rate}) '
+                             f'<= max_rate ({max_rate})')
+
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.slow_latency = slow_latency
+
+        self.lock = threading.Lock()
+        self.next_time = time.monotonic()  # Earliest time the next request may be sent
+        self.last_decrease = float('-inf')
+        self.total_wait = 0.0
+
+    def wait(self) -> float:
+        """Block until the next request may be sent and return how long that took"""
+        with self.lock:
+            now = time.monotonic()
+            send_time = max(now, self.next_time)
+            self.next_time = send_time + 1 / self.rate
+            self.total_wait += send_time - now
+
+        if send_time > now:
+            time.sleep(send_time - now)
+        return send_time - now
+
+    def pause(self, seconds: float) -> None:
+        """Don't send any more requests for this many seconds, e.g. when asked to by a Retry-After header"""
+        with self.lock:
+            self.next_time = max(self.next_time, time.monotonic() + seconds)
+
+    def on_response(self, latency: float, status_code: int = None) -> None:
+        """Adjust the rate after a response, status_code is None if the request failed"""
+        with self.lock:
+            if status_code is None or status_code in BACKOFF_STATUSES or latency > self.slow_latency:
+                # Responses to requests sent before the last decrease don't reflect it yet,
+                # so decrease at most once per request interval
+                now = time.monotonic()
+                if now - self.last_decrease > 1 / self.rate:
+                    self.rate = max(self.min_rate, self.rate * self.decrease)
+                    self.last_decrease = now
+                    logger.info(f'Rate limit decreased to {self.rate:.2f} requests/sec '
+                                f'(status {status_code}, latency {latency:.2f}s)')
+            else:
+                self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+
+def get_retry_after(response, now: datetime = None) -> float:
+    """Return the delay in seconds requested by a response's Retry-After header, or None"""
+    retry_after = response.headers.get('Retry-After')
+    if retry_after is None:
+        return None
+
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+
+    try:
+        retry_time = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_time - (now or datetime.now(timezone.utc))).total_seconds())
+
+
+class AdaptiveLimiterMixin:
+    """
+    Session mixin that sends requests through an AdaptiveRateLimiter. Failed requests and 429/503 responses are
+    retried up to `retries` times, after the delay in the Retry-After header if there is one (capped at `max_delay`)
+    or else an exponential backoff with full jitter.
+    Every request sent, including retries, is recorded in `metrics` (a scrape.metrics.ScrapeMetrics) if given.
+    """
+
+    def __init__(self, *args, limiter: AdaptiveRateLimiter = None, retries: int = 3, backoff: float = 1.0,
+                 max_delay: float = 60.0, metrics=None, **kwargs):
+        self.limiter = limiter or AdaptiveRateLimiter()
+        self.retries = retries
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.metrics = metrics
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        for attempt in range(self.retries + 1):
+            wait = self.limiter.wait()
+            start = time.monotonic()
+            try:
+                response = super().send(request, **kwargs)
+            except (ConnectionError, Timeout) as e:
+                latency = time.monotonic() - start
+                self.limiter.on_response(latency)
+                self._record(request, latency, None, wait)
+                if attempt == self.retries:
+                    raise
+                delay = self._backoff_delay(attempt)
+                logger.warning(f'Retrying {request.url} in {delay:.1f}s after {e.__class__.__name__}')
+                time.sleep(delay)
+                continue
+
+            latency = time.monotonic() - start
+            self.limiter.on_response(latency, response.status_code)
+            self._record(request, latency, response.status_code, wait)
+            if response.status_code not in BACKOFF_STATUSES or attempt == self.retries:
+                return response
+
+            response.close()
+            retry_after = get_retry_after(response)
+            if retry_after is not None:
+                # The server asked all our requests to wait, not just this one
+                delay = min(retry_after, self.max_delay)
+                self.limiter.pause(delay)
+            else:
+                delay = self._backoff_delay(attempt)
+                time.sleep(delay)
+            logger.warning(f'Retrying {request.url} in {delay:.1f}s after status {response.status_code}')
+
+    def _record(self, request, latency, status_code, wait):
+        if self.metrics is not None:
+            self.metrics.add_request(request.url, latency, status_code, wait)
+
+    def _backoff_delay(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.backoff * 2 ** attempt))
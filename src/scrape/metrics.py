@@ -0,0 +1,121 @@
+import json
+import time
+
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from threading import Lock
+
+# Upper bounds (seconds) of the request latency histogram buckets, the last bucket has no upper bound
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0)
+
+# Stages of a scrape, in pipeline order. The fetch stages include waiting for the rate limit.
+STAGES = ('guidebook_fetch', 'crag_fetch', 'climb_fetch', 'parse', 'flatten', 'write')
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def to_dict(self) -> dict:
+        n = sum(self.counts)
+        labels = [f'<={bound}' for bound in self.buckets] + [f'>{self.buckets[-1]}']
+        return {'n': n, 'mean': self.total / n if n else 0.0, 'max': self.max,
+                'buckets': dict(zip(labels, self.counts))}
+
+
+class ScrapeMetrics:
+    """
+    Thread-safe measurements of a scrape, reported by report() as a dict that can be saved as JSON.
+
+    Stage times are the time spent in each stage's calls, summed over threads and parse worker processes. Stages
+    overlap as crags are streamed through the pipeline, so with concurrency their sum can be more than the wall time of
+    the scrape.
+
+    :param page_kinds: Map of url pattern to the kind of page it matches (guidebook, crag or climb), the first matching
+        pattern applies
+    """
+
+    def __init__(self, page_kinds: dict = None):
+        self.page_kinds = page_kinds or {}
+        self.lock = Lock()
+        self.started = datetime.now(timezone.utc)
+        self.start_time = time.monotonic()
+
+        # Pages downloaded, cached, unchanged (revalidated), parse_reused and parse_failed, and climbs_written
+        self.counts = Counter()
+        self.bytes = Counter()  # Content bytes of the pages counted in counts, by where they came from
+        self.stage_seconds = Counter()
+        self.stage_calls = Counter()
+        self.latency = defaultdict(LatencyHistogram)  # Latency of requests sent to the server, by page kind
+        self.status_codes = Counter()  # 'error' for requests that failed without a response
+        self.limiter_wait = 0.0
+        self.failed_pages = []  # {'url': url, 'reason': reason}
+
+    def page_kind(self, url: str) -> str:
+        return next((kind for pattern, kind in self.page_kinds.items() if pattern.search(url)), 'other')
+
+    def count(self, key: str, n: int = 1, n_bytes: int = None) -> None:
+        with self.lock:
+            self.counts[key] += n
+            if n_bytes is not None:
+                self.bytes[key] += n_bytes
+
+    @contextmanager
+    def stage(self, name: str):
+        """Add the time spent in the context to a stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage_time(name, time.perf_counter() - start)
+
+    def add_stage_time(self, name: str, seconds: float) -> None:
+        with self.lock:
+            self.stage_seconds[name] += seconds
+            self.stage_calls[name] += 1
+
+    def add_request(self, url: str, latency: float, status_code: int = None, wait: float = 0.0) -> None:
+        """Record a request sent to the server, status_code is None if it failed, wait is the rate limit wait"""
+        with self.lock:
+            self.latency[self.page_kind(url)].add(latency)
+            self.status_codes[str(status_code) if status_code is not None else 'error'] += 1
+            self.limiter_wait += wait
+
+    def add_failed_page(self, url: str, reason: str) -> None:
+        with self.lock:
+            self.counts['parse_failed'] += 1
+            self.failed_pages.append({'url': url, 'reason': reason})
+
+    def report(self, **extra) -> dict:
+        """Return the metrics as a dict of JSON types, with any extra items added"""
+        with self.lock:
+            return {
+                'started': self.started.isoformat(timespec='seconds'),
+                'seconds': time.monotonic() - self.start_time,
+                'stages': {name: {'seconds': self.stage_seconds[name], 'calls': self.stage_calls[name]}
+                           for name in STAGES},
+                'counts': dict(self.counts),
+                'bytes': dict(self.bytes),
+                'requests': {
+                    'n': sum(self.status_codes.values()),
+                    'status_codes': dict(self.status_codes),
+                    'latency': {kind: histogram.to_dict() for kind, histogram in self.latency.items()},
+                    'limiter_wait_seconds': self.limiter_wait,
+                },
+                'failed_pages': list(self.failed_pages),
+                **extra,
+            }
+
+    def write_report(self, path: str, **extra) -> None:
+        with open(path, 'w') as f:
+            json.dump(self.report(**extra), f, indent=2)
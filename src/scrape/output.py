@@ -0,0 +1,127 @@
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+OUTPUT_FORMATS = ('csv', 'parquet', 'feather')
+
+# Typed columns of the climbs output, in output order. Columns with few distinct values are dictionary-encoded.
+CLIMB_SCHEMA = pa.schema([
+    ('name', pa.string()),
+    ('url', pa.string()),
+    ('grade', pa.dictionary(pa.int32(), pa.string())),
+    ('stars', pa.int8()),
+    ('logs', pa.int32()),
+    ('poll_grade', pa.string()),
+    ('poll_diff', pa.float64()),
+    ('crag', pa.dictionary(pa.int32(), pa.string())),
+    ('buttress', pa.string()),
+    ('desc', pa.string()),
+    ('symbols', pa.string()),
+    ('approach_time', pa.int32()),
+    ('rocktype', pa.dictionary(pa.int32(), pa.string())),
+    ('aspect', pa.dictionary(pa.int32(), pa.string())),
+])
+
+
+class ClimbWriter:
+    """
+    Write DataFrames of climbs to a file a batch at a time. The output is written to a temporary file and only moved
+    to `path` when the writer is closed without an error. It's deleted if the writer is aborted, so an interrupted
+    scrape doesn't leave a partial file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp_path = f'{path}.tmp'
+
+    def write(self, df: pd.DataFrame) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self) -> None:
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class CsvClimbWriter(ClimbWriter):
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.f = open(self.tmp_path, 'w', newline='')
+        pd.DataFrame(columns=CLIMB_SCHEMA.names).to_csv(self.f, index=False)
+
+    def write(self, df):
+        df.to_csv(self.f, index=False, header=False)
+
+    def close(self):
+        self.f.close()
+        super().close()
+
+    def abort(self):
+        self.f.close()
+        super().abort()
+
+
+def to_arrow(df: pd.DataFrame) -> pa.Table:
+    return pa.Table.from_pandas(df, schema=CLIMB_SCHEMA, preserve_index=False)
+
+
+class ParquetClimbWriter(ClimbWriter):
+    """Each batch is written as a row group, so only one batch is held in memory"""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.writer = pq.ParquetWriter(self.tmp_path, CLIMB_SCHEMA, compression='zstd')
+
+    def write(self, df):
+        if not df.empty:
+            self.writer.write_table(to_arrow(df))
+
+    def close(self):
+        self.writer.close()
+        super().close()
+
+    def abort(self):
+        self.writer.close()
+        super().abort()
+
+
+class FeatherClimbWriter(ClimbWriter):
+    """
+    The Feather (Arrow IPC) file format needs one dictionary per column for the whole file, so batches are kept as
+    Arrow tables, which are much smaller than the crags they came from, and written together when the writer is closed
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.tables = []
+
+    def write(self, df):
+        if not df.empty:
+            self.tables.append(to_arrow(df))
+
+    def close(self):
+        table = pa.concat_tables(self.tables) if self.tables else CLIMB_SCHEMA.empty_table()
+        feather.write_feather(table.unify_dictionaries(), self.tmp_path, compression='zstd')
+        super().close()
+
+
+CLIMB_WRITERS = {
+    'csv': CsvClimbWriter,
+    'parquet': ParquetClimbWriter,
+    'feather': FeatherClimbWriter,
+}
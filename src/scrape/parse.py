@@ -0,0 +1,291 @@
+import hashlib
+import json
+import re
+import warnings
+
+from bs4 import BeautifulSoup as bs, MarkupResemblesLocatorWarning
+from lxml import etree, html
+from pathlib import Path
+from typing import Iterable
+
+warnings.filterwarnings('ignore', category=MarkupResemblesLocatorWarning)
+
+# Changes whenever this module or lxml does, so that parse results cached by an earlier version aren't reused
+PARSER_VERSION = hashlib.blake2b(Path(__file__).read_bytes() + etree.__version__.encode(), digest_size=8).hexdigest()
+
+
+# Page parsers are plain module-level functions of the page content so that they can be run in a process pool
+
+
+CRAG_VARIABLES = ('table_data', 'grade_type_list', 'grade_list', 'buttress_data', 'climb_symbols', 'buttress_symbols')
+
+_json_decoder = json.JSONDecoder()
+_crag_variable_res = {
+    # Match a declaration "name =" (but not "name ==" or "x.name =" or "other_name =")
+    key: re.compile(rf'(?<![\w$.]){key}\s*=(?!=)\s*') for key in CRAG_VARIABLES
+}
+
+
+def parse_crag(content: bytes) -> dict:
+    """
+    Return a dict containing crag data
+    The crag data is contained in javascript variables in the <script> section that declares cragId
+
+    The script block is located by byte offset and each variable's value is read with a raw JSON decoder starting at
+    its declaration, so no DOM is built and the layout of the javascript (line breaks, indentation, order of the
+    declarations) does not matter. Falls back to parse_crag_soup if the script block can't be found or decoded.
+    """
+    try:
+        script = _find_script(content, b'cragId').decode('utf-8', errors='replace')
+
+        crag = dict.fromkeys(CRAG_VARIABLES)
+        for key, declaration_re in _crag_variable_res.items():
+            if match := declaration_re.search(script):
+                crag[key], _ = _json_decoder.raw_decode(script, match.end())
+    except ValueError:
+        return parse_crag_soup(content)
+
+    crag['climbs'] = crag.pop('table_data')
+    return crag
+
+
+def _find_script(content: bytes, marker: bytes) -> bytes:
+    """Return the contents of the first <script> element that contains marker"""
+    start = 0
+    while (offset := content.find(marker, start)) != -1:
+        script_start = content.rfind(b'<script', 0, offset)
+        if script_start != -1 and content.rfind(b'</script', script_start, offset) == -1:
+            script_start = content.index(b'>', script_start) + 1
+            script_end = content.find(b'</script', offset)
+            return content[script_start:script_end if script_end != -1 else len(content)]
+        start = offset + len(marker)
+
+    raise ValueError(f'No <script> containing {marker!r}')
+
+
+def parse_crag_soup(content: bytes) -> dict:
+    """Reference implementation of parse_crag using BeautifulSoup, which needs one variable declaration per line"""
+
+    soup = bs(content, 'lxml')
+    script = [x for x in soup.find_all('script') if 'cragId' in x.text][0]
+
+    crag = dict.fromkeys(CRAG_VARIABLES)
+
+    lines = script.text.strip().lstrip('let').rstrip(';').splitlines()
+    for line in lines:
+        ret = re.match(r'^([^=]*)=(.*)', line.lstrip().rstrip(','))
+        if ret:
+            key = ret.group(1).strip()
+            value = ret.group(2).strip()
+            if key in crag.keys():
+                crag[key] = json.loads(value)
+
+    crag['climbs'] = crag.pop('table_data')
+    return crag
+
+
+# A guidebook crag row has at least these cells, the first with a link to the crag page
+GUIDEBOOK_COLUMNS = ('name', 'nclimbs', 'rocktype', 'aspect')
+_guidebook_rows = etree.XPath('//tr[(td|th)[1]//a[contains(@href, "/logbook/crags/")]]')
+_hidden_elements = etree.XPath('//table[contains(translate(@style, " ", ""), "display:none")]|//table//style'
+                               '|//table//*[contains(translate(@style, " ", ""), "display:none")]')
+_cell_whitespace_re = re.compile(r'[\r\n]+|\s{2,}')
+
+
+def parse_guidebook(content: bytes) -> list[dict]:
+    """
+    Return a list of dict with the name, nclimbs, rocktype, aspect and href of each crag in a guidebook page's tables.
+
+    Crag rows are picked out by their structure in one pass over the table rows, wherever they are in the page:
+    a row with a crag link in its first cell and a number of climbs in its second. Header rows, title rows and rows of
+    other tables are skipped. Cell text is the same as pandas.read_html gives, which this replaces.
+    """
+    doc = html.document_fromstring(content.decode('utf-8', errors='replace'))
+
+    # Like read_html, ignore hidden tables and hidden elements in tables
+    for element in _hidden_elements(doc):
+        element.drop_tree()
+
+    crags = []
+    for row in _guidebook_rows(doc):
+        cells = row.xpath('./td|./th')
+        if len(cells) < len(GUIDEBOOK_COLUMNS):
+            continue
+
+        crag = {key: _cell_whitespace_re.sub(' ', cell.text_content().strip())
+                for key, cell in zip(GUIDEBOOK_COLUMNS, cells)}
+        if not crag['nclimbs'].isdigit():
+            continue
+
+        crag['nclimbs'] = int(crag['nclimbs'])
+        crag['href'] = cells[0].xpath('.//a/@href')[0]
+        crags.append(crag)
+
+    return crags
+
+
+POLL_VOTES_CLASS = 'progress-bar bg-success polltype1 progress-bar-striped'
+POLL_NAMES_CLASS = 'col-4 small text-right'
+
+_poll_votes_xpath = etree.XPath(f'//div[normalize-space(@class)="{POLL_VOTES_CLASS}"]')
+_poll_names_xpath = etree.XPath(f'//div[normalize-space(@class)="{POLL_NAMES_CLASS}"]')
+_utf8_html_parser = html.HTMLParser(encoding='utf-8')
+
+
+def parse_grade_poll(content: bytes) -> dict:
+    """
+    Return the grade poll votes on a climb page as a dict { '37hard,High 6b+': 0, ... }, or None if the vote
+    counts and grade names don't line up.
+
+    Only the poll divs are visited, using precompiled XPath queries on an lxml tree, which is much cheaper than
+    building a BeautifulSoup tree of the whole page. Falls back to parse_grade_poll_soup if lxml can't handle the page.
+    """
+    try:
+        root = html.fromstring(content, parser=_utf8_html_parser)
+    except (etree.ParserError, ValueError):
+        return parse_grade_poll_soup(content)
+
+    poll_data = {div.get('data-val'): int(div.get('data-n')) for div in _poll_votes_xpath(root)}
+    grade_name_list = [name for name in (div.text_content().strip() for div in _poll_names_xpath(root)) if name]
+
+    if len(poll_data) != len(grade_name_list):
+        return None
+
+    return {f"{grade_code},{grade_name}": votes for (grade_code, votes), grade_name in
+            zip(poll_data.items(), grade_name_list)}
+
+
+def parse_grade_poll_soup(content: bytes) -> dict:
+    """Reference implementation of parse_grade_poll using BeautifulSoup"""
+
+    # Get grade poll vote count - we assume that find_all preserves order
+    poll_data = dict()
+    soup = bs(content, 'html.parser')
+    poll_divs = soup.find_all('div', {'class': POLL_VOTES_CLASS})
+    for div in poll_divs:
+        poll_data[div.attrs['data-val']] = int(div.attrs['data-n'])
+
+    # Get grade poll grade names
+    grade_name_list = []
+    poll_grade_name_divs = soup.find_all('div', {'class': POLL_NAMES_CLASS})
+    for div in poll_grade_name_divs:
+        grade_name = div.text.strip()
+        if grade_name:
+            grade_name_list.append(grade_name)
+
+    if len(poll_data) != len(grade_name_list):
+        return None
+
+    # Return a dict { '37hard,High 6b+': 0, ... }
+    ret = {f"{grade_code},{grade_name}": votes for (grade_code, votes), grade_name in
+           zip(poll_data.items(), grade_name_list)}
+    return ret
+
+
+class _TextTarget:
+    """
+    lxml parser target that collects the text of an HTML fragment exactly as BeautifulSoup(markup, 'lxml').get_text()
+    would, without building a tree: whitespace-only strings collapse to a single space or newline (except in <pre> and
+    <textarea>) and the contents of <script>, <style> and <template> and comments are skipped
+    """
+    ASCII_SPACES = ' \n\t\x0c\r'
+    SKIP_TAGS = frozenset(('script', 'style', 'template'))
+    PRESERVE_TAGS = frozenset(('pre', 'textarea'))
+
+    def __init__(self):
+        self.parts = []
+        self.pending = None  # Text since the last tag, which lxml may deliver in several pieces
+        self.skip_depth = 0
+        self.preserve_depth = 0
+
+    def _flush(self):
+        data = self.pending
+        self.pending = None
+        if not self.preserve_depth and not data.strip(self.ASCII_SPACES):
+            data = '\n' if '\n' in data else ' '
+        if not self.skip_depth:
+            self.parts.append(data)
+
+    def start(self, tag, attrib):
+        if self.pending is not None:
+            self._flush()
+        if tag in self.SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag in self.PRESERVE_TAGS:
+            self.preserve_depth += 1
+
+    def end(self, tag):
+        if self.pending is not None:
+            self._flush()
+        if tag in self.SKIP_TAGS:
+            self.skip_depth -= 1
+        elif tag in self.PRESERVE_TAGS:
+            self.preserve_depth -= 1
+
+    def data(self, data):
+        self.pending = data if self.pending is None else self.pending + data
+
+    def comment(self, text):
+        if self.pending is not None:
+            self._flush()
+
+    def pi(self, target, data=None):
+        if self.pending is not None:
+            self._flush()
+
+    def doctype(self, *args):
+        if self.pending is not None:
+            self._flush()
+
+    def close(self):
+        if self.pending is not None:
+            self._flush()
+        text = ''.join(self.parts)
+        self.__init__()
+        return text
+
+
+# Fragments made only of text, inline tags and common entities, which can be converted without a parser. Attribute
+# values may not contain < or >, so every tag ends at the first >. Leading whitespace is excluded because libxml2 drops
+# some of it depending on the context. Whitespace-only text collapses to a single space or newline, so it's excluded
+# unless it's already a single space or newline and isn't next to whitespace that unmatched end tags would join it to.
+_SIMPLE_TEXT = r'[^<&\x00-\x08\x0b\x0d-\x1f]*'
+_SIMPLE_TAGS = r'(?:p|b|i|u|a|em|strong|span|sup|sub|small)'
+_SIMPLE_ATTRIBUTES = r'''(?: [a-z-]+(?:="[^"<>]*"|='[^'<>]*')?)*'''
+_SIMPLE_HTML_RE = re.compile(
+    _SIMPLE_TEXT + r'(?:(?:<(?:' + _SIMPLE_TAGS + _SIMPLE_ATTRIBUTES + '|/' + _SIMPLE_TAGS + r'|br ?/?)>'
+    r'|&(?:amp|lt|gt|quot|nbsp);)' + _SIMPLE_TEXT + ')*')
+_BLANK_TEXT_RE = re.compile(r'>(?:[\t\x0c]|[ \t\n\x0c]{2,}|[ \n](?:<[^>]*>)+[ \n])(?:<|$)')
+_LEADING_SPACE_RE = re.compile(r'(?:<[^>]*>)*[ \t\n\x0c]')
+_TAG_RE = re.compile(r'<[^>]*>')
+
+
+def _simple_html_to_text(fragment: str) -> str:
+    text = _TAG_RE.sub('', fragment)
+    if '&' in text:
+        # &amp; last so that e.g. &amp;lt; becomes &lt;
+        text = (text.replace('&lt;', '<').replace('&gt;', '>').replace('&quot;', '"').replace('&nbsp;', '\xa0')
+                .replace('&amp;', '&'))
+    return text
+
+
+def html_to_text(fragments: Iterable[str]) -> list[str]:
+    """
+    Return the text of each HTML fragment, identical to BeautifulSoup(fragment, 'lxml').get_text() but many times
+    faster. Simple fragments are converted with regexes, the rest by one reused parser that doesn't build a tree.
+    """
+    parser = None
+    texts = []
+    for fragment in fragments:
+        # BeautifulSoup drops a byte order mark at the start, and libxml2 may drop another one after it
+        fragment = fragment.removeprefix('\ufeff')
+        if (_SIMPLE_HTML_RE.fullmatch(fragment) and not _BLANK_TEXT_RE.search(fragment)
+                and not _LEADING_SPACE_RE.match(fragment) and not fragment.startswith('\ufeff')):
+            texts.append(_simple_html_to_text(fragment))
+            continue
+
+        if parser is None:
+            parser = etree.HTMLParser(target=_TextTarget(), recover=True)
+        parser.feed(fragment)
+        texts.append(parser.close())
+    return texts
@@ -0,0 +1,53 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import zlib
+
+
+class ParseCache:
+    """
+    Page parse results, keyed by parser and page url and stored with a digest of the page content they were parsed
+    from. A result is reused for as long as the page content is unchanged, e.g. after a 304 Not Modified response,
+    and the parsers are the same version. Results from other versions are deleted when the cache is opened.
+    """
+
+    def __init__(self, db_path: str, version: str):
+        self.version = version
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self.lock, self.connection:
+            # Losing a write on a crash only costs a re-parse, so don't wait for the disk
+            self.connection.execute('PRAGMA synchronous = OFF')
+            columns = [row[1] for row in self.connection.execute('PRAGMA table_info(parsed)')]
+            if columns and 'version' not in columns:
+                # Made before results were versioned, so their version is unknown
+                self.connection.execute('DROP TABLE parsed')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS parsed (parser TEXT, url TEXT, digest BLOB, '
+                                    'version TEXT, result BLOB, PRIMARY KEY (parser, url))')
+            self.connection.execute('DELETE FROM parsed WHERE version != ?', (version,))
+
+    @staticmethod
+    def digest(content: bytes) -> bytes:
+        return hashlib.blake2b(content, digest_size=16).digest()
+
+    def get(self, parser: str, url: str, digest: bytes) -> tuple[bool, object]:
+        """Return (True, result) if url was parsed by parser from content with this digest, else (False, None)"""
+        with self.lock:
+            row = self.connection.execute('SELECT result FROM parsed WHERE parser = ? AND url = ? AND digest = ? '
+                                          'AND version = ?', (parser, url, digest, self.version)).fetchone()
+        if row is None:
+            return False, None
+        return True, json.loads(zlib.decompress(row[0]))
+
+    def set(self, parser: str, url: str, digest: bytes, result: object) -> None:
+        value = zlib.compress(json.dumps(result).encode())
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO parsed VALUES (?, ?, ?, ?, ?)',
+                                    (parser, url, digest, self.version, value))
+
+    def clear(self) -> None:
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM parsed')
+        with self.lock:
+            self.connection.execute('VACUUM')
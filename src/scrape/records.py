@@ -0,0 +1,77 @@
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+
+# Records keep only the fields the scraper uses, in slots rather than a dict per record. Fields can't have defaults
+# in a dataclass with __slots__ on python < 3.10, so fields that are filled in later are passed as None.
+
+
+@dataclass
+class Climb:
+    __slots__ = ('name', 'slug', 'grade', 'gradetype', 'stars', 'logs', 'buttress_id', 'desc', 'symbols', 'url',
+                 'poll_grade_text', 'poll_diff')
+    name: str
+    slug: str
+    grade: int
+    gradetype: int
+    stars: int
+    logs: int
+    buttress_id: Optional[int]
+    desc: str
+    symbols: list  # Climb symbol ids
+    url: Optional[str]  # Set once the crag url is known
+    poll_grade_text: Optional[str]  # Set from the grade poll
+    poll_diff: Optional[float]
+
+    @classmethod
+    def from_table_data(cls, row: dict) -> 'Climb':
+        """Climb from a row of the table_data on a crag page"""
+        return cls(
+            name=row['name'],
+            slug=row['slug'],
+            grade=int(row['grade']),
+            gradetype=int(row['gradetype']),
+            stars=int(row['stars']),
+            logs=int(row['logs']),
+            buttress_id=row['buttress_id'],
+            desc=row['desc'] or '',
+            symbols=row['symbols'] or [],
+            url=None,
+            poll_grade_text=None,
+            poll_diff=None,
+        )
+
+
+@dataclass
+class Crag:
+    __slots__ = ('name', 'url', 'id', 'nclimbs', 'rocktype', 'aspect', 'climbs', 'buttresses', 'symbols')
+    name: str
+    url: str
+    id: int
+    nclimbs: int
+    rocktype: str
+    aspect: str
+    climbs: list  # Climb records
+    buttresses: dict  # Buttress id (str) => (name, approach time)
+    symbols: dict  # Climb symbol id (str) => name
+
+    @classmethod
+    def from_page(cls, crag_info: dict, crag_data: dict, gradetypes: Iterable[int]) -> 'Crag':
+        """
+        Crag from its row in the guidebook (see Scraper.scrape_guidebook) and its page data (see parse.parse_crag),
+        with only the climbs of the given grade types
+        """
+        gradetypes = set(gradetypes)
+        return cls(
+            name=crag_info['name'],
+            url=crag_info['url'],
+            id=crag_info['id'],
+            nclimbs=crag_info['nclimbs'],
+            rocktype=crag_info['rocktype'],
+            aspect=crag_info['aspect'],
+            climbs=[Climb.from_table_data(row) for row in crag_data['climbs'] if int(row['gradetype']) in gradetypes],
+            # Sometimes there is no buttress data, or a buttress's meta is missing or an empty JSON list
+            buttresses={buttress_id: (buttress['name'], (buttress.get('meta') or {}).get('approach_time', 0))
+                        for buttress_id, buttress in (crag_data['buttress_data'] or {}).items()},
+            symbols={symbol_id: symbol['name'] for symbol_id, symbol in (crag_data['climb_symbols'] or {}).items()},
+        )
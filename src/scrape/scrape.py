@@ -4,28 +4,69 @@ import numpy as np
 import os
 import pandas as pd
 import re
-import warnings
-
-from bs4 import BeautifulSoup as bs, MarkupResemblesLocatorWarning
-from io import StringIO
+import time
+import zlib
+
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from operator import attrgetter
+from datetime import timedelta
+from pandas.api.types import is_integer_dtype
 from pathlib import Path
+from threading import Lock
+from typing import Iterable, Iterator
 from urllib.parse import urljoin, urlsplit, urlunsplit
-from requests import Session
-from requests_cache import CacheMixin
-from requests_ratelimiter import LimiterMixin
+from requests import ConnectionError, Session
+from requests_cache import CacheMixin, SerializerPipeline, Stage, pickle_serializer
+
+from scrape.grade_poll import get_poll_diffs, get_poll_grades, poll_matrix
+from scrape.grades import GradeIndex
+from scrape.journal import Journal
+from scrape.limiter import AdaptiveLimiterMixin, AdaptiveRateLimiter
+from scrape.metrics import ScrapeMetrics
+from scrape.output import CLIMB_SCHEMA, CLIMB_WRITERS
+from scrape.parse import PARSER_VERSION, html_to_text, parse_crag, parse_grade_poll, parse_guidebook
+from scrape.parse_cache import ParseCache
+from scrape.records import Crag
 
-from scrape.grade_poll import get_poll_grade
+logger = logging.getLogger(__name__)
 
-# import scrape.block_network  # Uncomment to test caching
-# from line_profiler_pycharm import profile  # Uncomment to use profiling
 
+class CachedLimiterSession(CacheMixin, AdaptiveLimiterMixin, Session):
+    pass
 
-logger = logging.getLogger(__name__)
-warnings.filterwarnings('ignore', category=MarkupResemblesLocatorWarning)
 
+# Responses are pickled then zlib compressed, HTML compresses to around a tenth of its size
+compressed_serializer = SerializerPipeline(
+    [pickle_serializer, Stage(dumps=zlib.compress, loads=zlib.decompress)],
+    name='pickle-zlib',
+    is_binary=True
+)
 
-class CachedLimiterSession(CacheMixin, LimiterMixin, Session):
-    pass
+# Climb fields that are compared with the previous run in an incremental scrape, and the poll fields carried forward
+CLIMB_STATE_KEYS = ('grade', 'gradetype', 'stars', 'logs')
+CLIMB_POLL_KEYS = ('poll_grade_text', 'poll_diff')
+
+# Climb fields put in a DataFrame for the output, the description and symbols are converted from the records
+CLIMB_FIELDS = ['name', 'url', 'grade', 'gradetype', 'stars', 'logs', 'poll_grade_text', 'poll_diff', 'buttress_id']
+
+# Output columns, in order
+OUTPUT_COLUMNS = CLIMB_SCHEMA.names
+
+# Crags are flattened for output in batches of about this many climbs, large enough that the per-batch pandas
+# overhead is small but bounded so that crags can still be streamed
+FLATTEN_BATCH_CLIMBS = 2000
+
+# Url patterns of each kind of page, the first matching pattern applies
+PAGE_KINDS = {
+    re.compile(r'/logbook/crags/[^/]+/[^/]+'): 'climb',
+    re.compile(r'/logbook/crags/'): 'crag',
+    re.compile(r'/logbook/books/'): 'guidebook',
+}
+
+# How long each kind of page is cached for
+EXPIRE_AFTER = {'climb': timedelta(days=30), 'crag': timedelta(days=7), 'guidebook': timedelta(days=1)}
+URLS_EXPIRE_AFTER = {pattern: EXPIRE_AFTER[kind] for pattern, kind in PAGE_KINDS.items()}
 
 
 def get_base_url(url):
@@ -33,199 +74,490 @@ def get_base_url(url):
     return urlunsplit((url_parts.scheme, url_parts.netloc, '', '', ''))
 
 
+def timed_parse(parser, content: bytes) -> tuple[object, float]:
+    """Return parser(content) and the seconds it took, timed in the process that parses, e.g. a parse worker"""
+    start = time.perf_counter()
+    result = parser(content)
+    return result, time.perf_counter() - start
+
+
+def batch_crags(crags: Iterable[Crag], min_climbs: int) -> Iterator[list[Crag]]:
+    """Group consecutive crags into lists with at least min_climbs climbs (except the last)"""
+    batch = []
+    n_climbs = 0
+    for crag in crags:
+        batch.append(crag)
+        n_climbs += len(crag.climbs)
+        if n_climbs >= min_climbs:
+            yield batch
+            batch = []
+            n_climbs = 0
+
+    if batch:
+        yield batch
+
+
 class Scraper:
-    def __init__(self, data_dir='data'):
+    def __init__(self, data_dir='data', concurrency=1, parse_workers=1, revalidate=False,
+                 limiter: AdaptiveRateLimiter = None, retries=3, grade_types: Iterable[str] = ('sport',),
+                 offline=False):
+        """
+        :param data_dir: Directory for the request cache and output files
+        :param concurrency: Number of page requests in flight at once, still subject to the rate limit
+        :param parse_workers: Number of processes used to parse pages, 0 to use one per CPU core
+        :param revalidate: Check cached pages are up-to-date with a conditional request, even if they haven't expired
+        :param limiter: Rate limiter for requests to the server, by default starting at 5 requests/sec
+        :param retries: Number of times a failed or throttled request is retried
+        :param grade_types: Grade types of the climbs to scrape, by name (e.g. sport, trad, any case) or id (e.g. 3)
+        :param offline: Only serve pages from the cache, expired or not, ignoring refresh and revalidate. Fetching a
+            page that isn't cached raises ConnectionError
+        """
         self.data_dir = data_dir
+        self.concurrency = concurrency
+        self.parse_workers = parse_workers or os.cpu_count()
+        self.revalidate = revalidate
+        self.grade_types = grade_types
+        self.offline = offline
+
+        # Measurements of all scrapes by this Scraper. Pages are counted in stats as downloaded, cached (served from the
+        # cache) or unchanged (revalidated), along with parse results reused and pages that failed to parse
+        self.metrics = ScrapeMetrics(PAGE_KINDS)
+        self.stats = self.metrics.counts
         Path(self.data_dir).mkdir(parents=True, exist_ok=True)
 
         self.session = CachedLimiterSession(
             cache_name=os.path.join(self.data_dir, 'ukc-cache'),
-            per_second=5,
-            backend='filesystem'
+            limiter=limiter or AdaptiveRateLimiter(rate=5),
+            retries=retries,
+            metrics=self.metrics,
+            backend='sqlite',
+            serializer=compressed_serializer,
+            urls_expire_after=URLS_EXPIRE_AFTER,
+            only_if_cached=offline,
+            stale_if_error=offline
         )
+        self.parse_cache = ParseCache(os.path.join(self.data_dir, 'ukc-parsed.sqlite'), PARSER_VERSION)
 
-    def scrape_guidebook_and_contents(self, guidebook_url: str, refresh: bool = False) -> list[dict]:
+        # One pool of parse worker processes for every page parsed, e.g. by areas scraped at the same time, started
+        # the first time it's needed
+        self.parse_pool = None
+        self.parse_pool_lock = Lock()
+
+        # Grades are the same on every crag page, so they are kept once for all crags and runs
+        self.grades_file = os.path.join(self.data_dir, 'ukc-grades.json')
+        self.grades = GradeIndex.load(self.grades_file)
+
+    def scrape_guidebook_and_contents(self, guidebook_url: str, refresh: bool = False,
+                                      previous_state: dict = None, journal: Journal = None) -> list[Crag]:
         """
 
         :param guidebook_url:
         :param refresh: Force refresh of the cache
-        :return: A list of dict, each dict is info for a crag
+        :param previous_state: Climb state from a previous run (see read_climb_state) for an incremental scrape.
+            Grade polls are only fetched for climbs that are new or whose grade, stars or log count have changed,
+            other climbs keep their previous poll results.
+        :param journal: Journal to record finished crags and climbs in. Crags and climbs already in the journal, from
+            an earlier run that was interrupted, are not scraped again.
+        :return: A list of Crag records, with their climbs
+        """
+        return list(self.iter_guidebook_and_contents(guidebook_url, refresh, previous_state, journal))
+
+    def iter_guidebook_and_contents(self, guidebook_url: str, refresh: bool = False,
+                                    previous_state: dict = None, journal: Journal = None) -> Iterator[Crag]:
+        """
+        Like scrape_guidebook_and_contents, but yield each crag, in guidebook order, as soon as its grade polls are
+        done. Nothing else keeps a reference to a crag once it has been yielded, so a consumer that writes out and
+        drops each crag only needs memory for the crags in flight rather than the whole guidebook.
         """
 
         logger.info(f'Scraping guidebook {guidebook_url}')
-        crag_list = self.scrape_guidebook(guidebook_url, refresh)
-
-        for n_crag, crag in enumerate(crag_list, start=1):
-            logger.info(f'Scraping crag {n_crag}/{len(crag_list)} {crag["url"]}')
-            crag_data = self.scrape_crag(crag['url'], refresh)
-            crag.update(crag_data)
-
-        # Sport climbing only
-        for crag in crag_list:
-            crag['climbs'] = list(filter(lambda x: x['gradetype'] == 3, crag['climbs']))
-
-        # crag_list = crag_list[0:1]  # Uncomment for testing (scrape only first crag)
-        total_climbs = sum(len(crag['climbs']) for crag in crag_list)
-        total_done = 0.0
-
-        for n_crag, crag in enumerate(crag_list, start=1):
-            for n_climb, climb in enumerate(crag['climbs']):
-                total_done += 1
-                climb_url = urljoin(crag['url'], climb['slug'])
-                climb['url'] = climb_url
-                logger.info(f'{total_done * 100 / total_climbs:.1f}% - Scraping climb {n_climb}/{len(crag["climbs"])}, '
-                            f'crag {n_crag}/{len(crag_list)} {climb_url}')
-
-                if poll_data := self.scrape_grade_poll(climb_url, refresh):
-                    grade_dict = crag['grade_list'][str(climb['gradetype'])]
-                    guidebook_grade_score = grade_dict[str(climb['grade'])]['score']
-                    poll_grade_text, poll_grade_code, score_modifier = get_poll_grade(poll_data)
-                    climb['poll_grade_text'] = poll_grade_text
-
-                    if poll_grade_code in grade_dict:
-                        climb['poll_diff'] = \
-                            guidebook_grade_score - (grade_dict[poll_grade_code]['score'] + score_modifier)
-                    else:
-                        climb['poll_diff'] = -0.01
+        crags = self._iter_crags(self.scrape_guidebook(guidebook_url, refresh), refresh, journal)
+
+        # Climb pages from consecutive crags are fetched in one stream, so the pools stay busy across crag boundaries.
+        # Crags wait here until their last climb is done. Both queues are in guidebook order.
+        pending_crags = deque()  # {'crag': crag, 'n_pending': number of climbs being scraped, 'listed': all queued,
+        #                            'polls': [(climb, poll_data) for each scraped climb]}
+        pending_climbs = deque()  # (entry in pending_crags, climb) for each climb being scraped
+
+        def climbs_to_scrape():
+            for n_crag, n_crags, crag in crags:
+                entry = {'crag': crag, 'n_pending': 0, 'listed': False, 'polls': []}
+                pending_crags.append(entry)
+
+                for n_climb, climb in enumerate(crag.climbs, start=1):
+                    climb.url = urljoin(crag.url, climb.slug)
+                    if previous_state is not None and self._carry_forward(climb, previous_state):
+                        continue
+                    if journal is not None and climb.url in journal.climbs:
+                        entry['polls'].append((climb, journal.climbs.pop(climb.url)))
+                        continue
+
+                    entry['n_pending'] += 1
+                    pending_climbs.append((entry, climb))
+                    yield n_crag, n_crags, n_climb, crag, climb
+
+                entry['listed'] = True
+
+        def fetch_climb(item):
+            n_crag, n_crags, n_climb, crag, climb = item
+            content = self.fetch(climb.url, refresh)
+            logger.info(f'Fetched climb {n_climb}/{len(crag.climbs)}, crag {n_crag}/{n_crags} {climb.url}')
+            return climb.url, content
+
+        def finished_crags():
+            while pending_crags and pending_crags[0]['listed'] and pending_crags[0]['n_pending'] == 0:
+                entry = pending_crags.popleft()
+                self._set_poll_results(entry['polls'])
+                yield entry['crag']
+
+        # Results are yielded in submission order, so the output matches a serial scrape.
+        # Polls are only collected here and aggregated a crag at a time once all of the crag's polls are parsed.
+        climb_pages = self._map(fetch_climb, climbs_to_scrape())
+        for poll_data in self._parse(parse_grade_poll, climb_pages):
+            entry, climb = pending_climbs.popleft()
+            entry['polls'].append((climb, poll_data))
+            if journal is not None:
+                journal.add_climb(climb.url, poll_data)
+
+            entry['n_pending'] -= 1
+            yield from finished_crags()
+
+        # Crags at the end of the guidebook with no climbs to scrape
+        yield from finished_crags()
+
+        if self.grades.changed:
+            self.grades.save(self.grades_file)
+
+    def _iter_crags(self, crag_list, refresh, journal):
+        """Yield (n_crag, n_crags, crag) for each crag in crag_list, in order, with its page data added"""
+        n_crags = len(crag_list)
+        crag_queue = deque(enumerate(crag_list, start=1))
+        del crag_list  # So that a crag is only referenced by the consumer once it has been yielded
+
+        # Crags in the journal aren't fetched again, but are still yielded in guidebook order
+        pending_crags = deque()  # [n_crag, crag, crag data or None until parsed]
+        fetching_crags = deque()  # Entries in pending_crags whose page is being fetched and parsed
+
+        def crags_to_fetch():
+            while crag_queue:
+                n_crag, crag = crag_queue.popleft()
+                entry = [n_crag, crag, None]
+                pending_crags.append(entry)
+                if journal is not None and crag['url'] in journal.crags:
+                    entry[2] = journal.crags.pop(crag['url'])
                 else:
-                    climb['poll_grade_text'] = 'Bad poll data'
-                    climb['poll_diff'] = -0.01
+                    fetching_crags.append(entry)
+                    yield n_crag, crag
+
+        def fetch_crag(item):
+            n_crag, crag = item
+            content = self.fetch(crag['url'], refresh)
+            logger.info(f'Fetched crag {n_crag}/{n_crags} {crag["url"]}')
+            return crag['url'], content
+
+        def finished_crags():
+            while pending_crags and pending_crags[0][2] is not None:
+                n_crag, crag_info, crag_data = pending_crags.popleft()
+                self.grades.add(crag_data['grade_list'], crag_data['grade_type_list'])
+                yield n_crag, n_crags, Crag.from_page(crag_info, crag_data, self.grades.gradetype_ids(self.grade_types))
+
+        crag_pages = self._map(fetch_crag, crags_to_fetch())
+        for crag_data in self._parse(parse_crag, crag_pages):
+            entry = fetching_crags.popleft()
+            entry[2] = crag_data
+            if journal is not None:
+                journal.add_crag(entry[1]['url'], crag_data)
+            yield from finished_crags()
+
+        yield from finished_crags()
+
+    def _set_poll_results(self, polls):
+        """Set the poll grade and poll_diff of the climbs in polls, a list of (climb, poll_data), in one batch"""
+        bad_polls = [climb for climb, poll_data in polls if not poll_data]
+        for climb in bad_polls:
+            climb.poll_grade_text = 'Bad poll data'
+            climb.poll_diff = -0.01
+            self.metrics.add_failed_page(climb.url, 'No grade poll found')
+
+        polls = [(climb, poll_data) for climb, poll_data in polls if poll_data]
+        if not polls:
+            return
+
+        climbs = [climb for climb, _ in polls]
+        gradetypes = np.array([climb.gradetype for climb in climbs])
+        guidebook_scores = self.grades.lookup_scores(gradetypes, [climb.grade for climb in climbs])
+        if np.isnan(guidebook_scores).any():
+            missing = [climb.url for climb, score in zip(climbs, guidebook_scores) if np.isnan(score)]
+            raise KeyError(f'Climb grades not in the grade index: {missing}')
+
+        grade_text, grade_code, grade_modifier = get_poll_grades(*poll_matrix([poll_data for _, poll_data in polls]))
+        poll_codes = [int(code) if code.isdigit() else -1 for code in grade_code]  # 'No votes' has no grade
+        poll_diffs = get_poll_diffs(guidebook_scores, self.grades.lookup_scores(gradetypes, poll_codes), grade_modifier)
+
+        for climb, text, poll_diff in zip(climbs, grade_text, poll_diffs.tolist()):
+            climb.poll_grade_text = text
+            climb.poll_diff = poll_diff
+
+    def log_stats(self) -> None:
+        logger.info(f'{self.stats["unchanged"]} pages unchanged since they were cached, '
+                    f'{self.stats["downloaded"]} downloaded, {self.stats["cached"]} served from the cache, '
+                    f'{self.stats["parse_reused"]} parse results reused, {self.stats["parse_failed"]} failed to parse')
+
+    def write_report(self, report_file: str, **extra) -> None:
+        """Write the metrics of all scrapes by this Scraper (see ScrapeMetrics.report) as JSON, with any extra items"""
+        report_path = os.path.join(self.data_dir, report_file)
+        self.metrics.write_report(report_path, rate_limit=self.session.limiter.rate, **extra)
+        logger.info(f'Run report written to {report_path}')
+
+    @staticmethod
+    def _carry_forward(climb, previous_state):
+        """If climb is unchanged since the previous run, copy its previous poll results and return True"""
+        previous = previous_state.get(climb.url)
+        if previous is None or previous['poll_grade_text'] == 'Bad poll data':
+            return False
+        if any(previous[key] != getattr(climb, key) for key in CLIMB_STATE_KEYS):
+            return False
+
+        for key in CLIMB_POLL_KEYS:
+            setattr(climb, key, previous[key])
+        return True
+
+    def read_climb_state(self, state_file: str) -> dict:
+        """Return the climb state written by write_climb_state, or an empty dict if there is none"""
+        state_path = os.path.join(self.data_dir, state_file)
+        if not os.path.exists(state_path):
+            logger.warning(f'No previous climb state found at {state_path}, all climbs will be scraped')
+            return {}
+
+        with open(state_path) as f:
+            return json.load(f)
+
+    @staticmethod
+    def get_climb_state(crag: Crag) -> dict:
+        """Return the fields of each climb in a crag needed for a later incremental scrape, keyed by climb url"""
+        return {climb.url: {key: getattr(climb, key) for key in CLIMB_STATE_KEYS + CLIMB_POLL_KEYS}
+                for climb in crag.climbs}
+
+    def write_climb_state(self, state: dict, state_file: str) -> None:
+        """Save climb state, collected from get_climb_state for each crag, for read_climb_state"""
+        state_path = os.path.join(self.data_dir, state_file)
+        with open(state_path, 'w') as f:
+            json.dump(state, f)
+        logging.info(f'Climb state written to {state_path}')
+
+    def _map(self, fn, items):
+        """
+        Like map(), but with up to self.concurrency calls in flight. Results are yielded in order.
+        Items are taken from the iterable lazily, only as far ahead as needed to keep the thread pool busy.
+        """
+        if self.concurrency <= 1:
+            yield from map(fn, items)
+            return
 
-        return crag_list
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pending = deque()
+            for item in items:
+                pending.append(executor.submit(fn, item))
+                if len(pending) > self.concurrency:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+
+    def _parse(self, parser, pages):
+        """
+        Apply a page parser from scrape.parse to each (url, content) in pages, on a process pool if parse_workers > 1.
+        Results are yielded in order. A page whose content hasn't changed since it was last parsed isn't parsed again.
+        """
+        executor = self._parse_pool() if self.parse_workers > 1 else None
+        pending = deque()
+        for url, content in pages:
+            digest = self.parse_cache.digest(content)
+            found, result = self.parse_cache.get(parser.__name__, url, digest)
+            if found or not executor:
+                future = Future()
+                future.set_result((result, 0.0) if found else timed_parse(parser, content))
+            else:
+                future = executor.submit(timed_parse, parser, content)
+            pending.append((url, digest, found, future))
+
+            while pending and pending[0][3].done():
+                yield self._parsed(parser, *pending.popleft())
+
+        while pending:
+            yield self._parsed(parser, *pending.popleft())
+
+    def _parse_pool(self):
+        with self.parse_pool_lock:
+            if self.parse_pool is None:
+                self.parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers)
+            return self.parse_pool
+
+    def close(self) -> None:
+        """Shut down the parse workers, a later scrape starts new ones"""
+        with self.parse_pool_lock:
+            pool, self.parse_pool = self.parse_pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def _parsed(self, parser, url, digest, found, future):
+        result, seconds = future.result()
+        if found:
+            self.metrics.count('parse_reused')
+            return result
+
+        self.metrics.add_stage_time('parse', seconds)
+        self.parse_cache.set(parser.__name__, url, digest, result)
+        return result
 
     def scrape_guidebook(self, guidebook_url: str, refresh: bool) -> list[dict]:
         """Return a list of dict, where each dict is crag info"""
-        response = self.session.get(guidebook_url, refresh=refresh)
+        content = self.fetch(guidebook_url, refresh)
         base_url = get_base_url(guidebook_url)
-
-        df_scraped_tables = pd.read_html(StringIO(response.text), extract_links='all')
-
-        # El-chorro guidebook has an initial table that we're not interested in
-        if 'chorro' in guidebook_url or 'kalymnos' in guidebook_url:
-            df_scraped_tables = df_scraped_tables[1:]
-
-        df_crags = pd.DataFrame(np.vstack(df_scraped_tables), columns=df_scraped_tables[0].columns)
-        df_crags.columns = ['crag', 'nclimbs', 'rocktype', 'aspect']
-
-        # read_html extract_links makes each cell a tuple (link_text, link_path)
-        # Extract the elements of the tuple into separate columns
-        df_crags['name'] = df_crags['crag'].apply(pd.Series)[0]
-        df_crags['url'] = base_url + df_crags['crag'].apply(pd.Series)[1] + "/"
-
-        # The crag table may contain title rows that we are not interested in
-        n_crags_before = len(df_crags.index)
-        df_crags = df_crags.dropna()
-        n_rows_with_nan = abs(n_crags_before - len(df_crags.index))
-        if n_rows_with_nan:
-            logging.warning(f'{n_rows_with_nan} guidebook crag rows contained NaN and were dropped')
-
-        df_crags['nclimbs'] = df_crags['nclimbs'].apply(pd.Series)[0].apply(int)
-        df_crags['rocktype'] = df_crags['rocktype'].apply(pd.Series)[0]
-        df_crags['aspect'] = df_crags['aspect'].apply(pd.Series)[0]
-        df_crags['id'] = df_crags.url.str.extract('(\d+)')
-        df_crags['id'] = df_crags.id.apply(int)
-        df_crags = df_crags[['name', 'nclimbs', 'rocktype', 'aspect', 'url', 'id']]
-
-        crag_list = df_crags.to_dict(orient='records')
+        with self.metrics.stage('parse'):
+            crags = parse_guidebook(content)
+
+        crag_list = []
+        for crag in crags:
+            href = crag.pop('href')
+            # The id is the last number in the crag's path e.g. /logbook/crags/las_encantadas-2485, not one in base_url
+            crag_list.append(dict(crag, url=base_url + href + '/', id=int(re.findall(r'\d+', href)[-1])))
         return crag_list
 
     def scrape_crag(self, crag_url: str, refresh: bool) -> dict:
-        """
-        Return a dict containing crag data
-        The crag data is contained in javascript variables in <script> section
-        """
-
-        response = self.session.get(crag_url, refresh=refresh)
-        soup = bs(response.content, 'lxml')
-        script = [x for x in soup.find_all('script') if 'cragId' in x.text][0]
-
-        crag = {
-            'table_data': None,
-            'grade_type_list': None,
-            'grade_list': None,
-            'buttress_data': None,
-            'climb_symbols': None,
-            'buttress_symbols': None
-        }
-
-        lines = script.text.strip().lstrip('let').rstrip(';').splitlines()
-        for line in lines:
-            ret = re.match(r'^([^=]*)=(.*)', line.lstrip().rstrip(','))
-            if ret:
-                key = ret.group(1).strip()
-                value = ret.group(2).strip()
-                if key in crag.keys():
-                    crag[key] = json.loads(value)
-
-        crag['climbs'] = crag.pop('table_data')
-        return crag
+        """Return a dict containing crag data"""
+        return parse_crag(self.fetch(crag_url, refresh))
 
     def scrape_grade_poll(self, climb_url: str, refresh: bool) -> dict:
-        response = self.session.get(climb_url, refresh=refresh)
-
-        # Get grade poll vote count - we assume that find_all preserves order
-        poll_data = dict()
-        soup = bs(response.content, 'html.parser')
-        poll_divs = soup.find_all('div', {'class': 'progress-bar bg-success polltype1 progress-bar-striped'})
-        for div in poll_divs:
-            poll_data[div.attrs['data-val']] = int(div.attrs['data-n'])
-
-        # Get grade poll grade names
-        grade_name_list = []
-        poll_grade_name_divs = soup.find_all('div', {'class': 'col-4 small text-right'})
-        for div in poll_grade_name_divs:
-            grade_name = div.text.strip()
-            if grade_name:
-                grade_name_list.append(grade_name)
-
-        if len(poll_data) != len(grade_name_list):
-            return None
-
-        # Return a dict { '37hard,High 6b+': 0, ... }
-        ret = {f"{grade_code},{grade_name}": votes for (grade_code, votes), grade_name in
-               zip(poll_data.items(), grade_name_list)}
-        return ret
-
-    def write_climbs_csv(self, crag_list: list[dict], out_file: str) -> None:
-        # Flatten data and extract fields of interest
-
-        list_of_climbs = list()
-        for crag in crag_list:
-            for climb in crag['climbs']:
-
-                c = dict()
-                c['name'] = climb['name']
-                c['url'] = climb['url']
-                # Convert grade to text e.g. 36 (int) => 6a (str)
-                c['grade'] = crag['grade_list'][str(climb['gradetype'])][str(climb['grade'])]['name']
-                c['stars'] = climb['stars']
-                c['logs'] = climb['logs']
-                c['poll_grade'] = climb['poll_grade_text']
-                c['poll_diff'] = climb['poll_diff']
-                c['crag'] = crag['name']
-
-                # Sometimes there is no buttress data
-                buttress_id_str = str(climb['buttress_id'])
-                if buttress_id_str in crag['buttress_data']:
-                    c['buttress'] = crag['buttress_data'][buttress_id_str]['name']
-
-                c['desc'] = (bs(climb['desc'], 'lxml').get_text()
-                             .removeprefix('Rockfax Description')
-                             .removeprefix('UKClimbing Description'))
-                c['symbols'] = ', '.join([crag['climb_symbols'][str(s)]['name'] for s in climb['symbols']
-                                          if str(s) in crag['climb_symbols']])
-
-                c['approach_time'] = 0
-                if buttress_id_str in crag['buttress_data']:
-                    if 'approach_time' in crag['buttress_data'][buttress_id_str]['meta']:
-                        c['approach_time'] = crag['buttress_data'][buttress_id_str]['meta']['approach_time']
-
-                c['rocktype'] = crag['rocktype']
-                c['aspect'] = crag['aspect']
-
-                list_of_climbs.append(c)
-
-        df_climbs = pd.DataFrame(list_of_climbs)
+        """Return the grade poll votes for a climb, or None if the poll could not be parsed"""
+        poll_data = parse_grade_poll(self.fetch(climb_url, refresh))
+        if not poll_data:
+            self.metrics.add_failed_page(climb_url, 'No grade poll found')
+        return poll_data
+
+    def fetch(self, url: str, refresh: bool) -> bytes:
+        """
+        Return the content of a page, from the cache if it hasn't expired. refresh=True always refetches.
+        Expired pages, and all pages if self.revalidate is set, are revalidated with If-None-Match/If-Modified-Since
+        and the cached content is reused on a 304 Not Modified response.
+        """
+        online = not self.offline
+        with self.metrics.stage(f'{self.metrics.page_kind(url)}_fetch'):
+            response = self.session.get(url, force_refresh=refresh and online, refresh=self.revalidate and online)
+        if self.offline and response.status_code == 504:
+            raise ConnectionError(f'{url} is not cached and the scraper is offline')
+        if not getattr(response, 'from_cache', False):
+            self.metrics.count('downloaded', n_bytes=len(response.content))
+        elif response.revalidated:
+            self.metrics.count('unchanged', n_bytes=len(response.content))
+        else:
+            self.metrics.count('cached', n_bytes=len(response.content))
+        return response.content
+
+    def prune_cache(self, older_than: timedelta = None) -> None:
+        """
+        Delete expired responses (and optionally any older than older_than) from the cache and vacuum it. Parse results
+        are only deleted along with every response, a result for a deleted response is just not found again.
+        """
+        n_before = self.session.cache.responses.count()
+        if older_than == timedelta(0):
+            self.session.cache.clear()
+            self.parse_cache.clear()
+        elif older_than is not None:
+            self.session.cache.delete(expired=True, older_than=older_than, vacuum=False)
+        else:
+            self.session.cache.delete(expired=True, vacuum=False)
+        # delete() doesn't vacuum when it's given older_than, so vacuum here whichever responses were deleted
+        self.session.cache.responses.vacuum()
+        n_after = self.session.cache.responses.count()
+        logger.info(f'Deleted {n_before - n_after} responses from the cache, {n_after} remaining')
+
+    def write_climbs(self, crags: Iterable[Crag], out_file: str, fmt: str = 'csv') -> None:
+        """
+        Write the climbs of each crag to a file in one of OUTPUT_FORMATS. Crags are flattened and written a batch at
+        a time, so crags can be streamed in from iter_guidebook_and_contents.
+        """
         out_path = os.path.join(self.data_dir, out_file)
-        df_climbs.to_csv(out_path, index=False)
-        logging.info(f'CSV written to {out_path}')
+        writer = CLIMB_WRITERS[fmt](out_path)
+        try:
+            for batch in batch_crags(crags, FLATTEN_BATCH_CLIMBS):
+                with self.metrics.stage('flatten'):
+                    df = self.flatten_crags(batch, self.grades)
+                with self.metrics.stage('write'):
+                    writer.write(df)
+                self.metrics.count('climbs_written', len(df.index))
+        except BaseException:
+            writer.abort()
+            raise
+        with self.metrics.stage('write'):
+            writer.close()
+
+        logging.info(f'{fmt} written to {out_path}')
+
+    def write_climbs_csv(self, crags: Iterable[Crag], out_file: str) -> None:
+        self.write_climbs(crags, out_file, 'csv')
+
+    @staticmethod
+    def flatten_crags(crags: list[Crag], grades: GradeIndex) -> pd.DataFrame:
+        """
+        Flatten the data for a list of crags into a DataFrame with a row of the fields of interest for each climb.
+        Columns are built in bulk, with grade names looked up in the grade index and buttress names resolved by joins
+        against per-crag lookup frames
+        """
+        climb_fields = attrgetter(*CLIMB_FIELDS)
+        climbs = pd.DataFrame.from_records([climb_fields(climb) for crag in crags for climb in crag.climbs],
+                                           columns=CLIMB_FIELDS)
+        if climbs.empty:
+            return pd.DataFrame(columns=OUTPUT_COLUMNS)
+
+        climbs['crag_index'] = np.repeat(np.arange(len(crags)), [len(crag.climbs) for crag in crags])
+
+        # Convert grade to text e.g. 36 (int) => 6a (str)
+        climbs['grade_name'] = grades.lookup_names(climbs['gradetype'], climbs['grade'])
+        if climbs['grade_name'].isna().any():
+            missing = climbs.loc[climbs['grade_name'].isna(), ['gradetype', 'grade']].drop_duplicates()
+            raise KeyError(f'Grades not in the grade index: {missing.values.tolist()}')
+
+        # Lookup keys in the crag data are strings e.g. buttress_data['501']
+        climbs['buttress_id'] = climbs['buttress_id'].astype(str)
+
+        df_buttresses = pd.DataFrame(
+            [(crag_index, buttress_id, name, approach_time)
+             for crag_index, crag in enumerate(crags)
+             for buttress_id, (name, approach_time) in crag.buttresses.items()],
+            columns=['crag_index', 'buttress_id', 'buttress', 'approach_time']
+        )
+        climbs = climbs.merge(df_buttresses, how='left', on=['crag_index', 'buttress_id'])
+        approach_time = climbs['approach_time'].fillna(0)
+        if is_integer_dtype(df_buttresses['approach_time']):
+            approach_time = approach_time.astype(df_buttresses['approach_time'].dtype)
+
+        crag_columns = (pd.DataFrame([(crag.name, crag.rocktype, crag.aspect) for crag in crags],
+                                     columns=['name', 'rocktype', 'aspect'])
+                        .take(climbs['crag_index']).reset_index(drop=True))
+
+        # Symbols are a ragged list per climb, join the names of known symbols in the order they're listed. This and the
+        # descriptions are read from the records, which is faster than iterating the DataFrame's string columns.
+        symbols = [', '.join([crag.symbols[str(s)] for s in climb.symbols if str(s) in crag.symbols])
+                   for crag in crags for climb in crag.climbs]
+
+        desc = (pd.Series(html_to_text([climb.desc for crag in crags for climb in crag.climbs]), index=climbs.index)
+                .str.removeprefix('Rockfax Description')
+                .str.removeprefix('UKClimbing Description'))
+
+        return pd.DataFrame({
+            'name': climbs['name'],
+            'url': climbs['url'],
+            'grade': climbs['grade_name'],
+            'stars': climbs['stars'],
+            'logs': climbs['logs'],
+            'poll_grade': climbs['poll_grade_text'],
+            'poll_diff': climbs['poll_diff'],
+            'crag': crag_columns['name'],
+            'buttress': climbs['buttress'],
+            'desc': desc,
+            'symbols': symbols,
+            'approach_time': approach_time,
+            'rocktype': crag_columns['rocktype'],
+            'aspect': crag_columns['aspect'],
+        }, columns=OUTPUT_COLUMNS)
@@ -7,7 +7,7 @@ from pathlib import Path
 # Add src dir to python path so streamlit can find modules
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
-from starchaser.utils import get_climb_data, get_logbook_data, GuidebookInfo, poll_grade_sort_key
+from starchaser.utils import get_climb_store, get_logbook_data, get_logbook_matches, GuidebookInfo
 
 st.set_page_config(
     page_title='Starchaser',
@@ -55,24 +55,19 @@ with st.sidebar:
         format_func=GuidebookInfo.to_display_name
     )
 
-df = get_climb_data(area)
-df_unfiltered = df
-total_climbs = len(df.index)
-crag_list = sorted(df['crag'].unique().tolist())
-grade_list = sorted(df['grade'].unique().tolist())
+store = get_climb_store()
+total_climbs, crag_list, grade_list = store.summary(area)
 
 with st.sidebar:
     selected_crags = st.multiselect(
         'Select crags',
         options=crag_list
     )
-    if not selected_crags:
-        selected_crags = crag_list
 
     min_grade, max_grade = st.select_slider(
         'Select grade range',
         options=grade_list,
-        value=(min(grade_list), max(grade_list))
+        value=(grade_list[0], grade_list[-1])
     )
 
     selected_stars = []
@@ -88,28 +83,25 @@ with st.sidebar:
     logbook_file = st.file_uploader('Upload UKC logbook (DLOG format)')
 
 
-df = df.loc[
-    (df['crag'].isin(selected_crags)) &
-    (df['grade'] >= min_grade) &
-    (df['grade'] <= max_grade) &
-    (df['stars'].isin(selected_stars))
-    ]
+# No crags selected means all crags
+df = store.climbs(area, crags=selected_crags or None, min_grade=min_grade, max_grade=max_grade, stars=selected_stars)
 
 exclude_logs = False
 with st.sidebar:
-    df_logs, f = get_logbook_data(logbook_file)
-    if df_logs is None:
+    logbook, logbook_name = get_logbook_data(logbook_file)
+    if logbook is None:
         st.markdown('No logbook uploaded')
     else:
         exclude_logs = st.checkbox(f'Exclude climbs in logbook', value=True)
-        df_matched = df.loc[df['name'].isin(df_logs['Name'])]
+        in_logbook = df.index.isin(get_logbook_matches(store, area, logbook))
+        df_matched = df.loc[in_logbook]
         n_matched = len(df_matched.index)
 
         if exclude_logs:
-            st.markdown(f'{n_matched} climbs in {f.name} matched and were excluded')
-            df = df.loc[~df['name'].isin(df_logs['Name'])]
+            st.markdown(f'{n_matched} climbs in {logbook_name} matched and were excluded')
+            df = df.loc[~in_logbook]
         else:
-            st.markdown(f'{n_matched} climbs in {f.name} matched')
+            st.markdown(f'{n_matched} climbs in {logbook_name} matched')
 
     n_climbs = len(df.index)
     if n_climbs:
@@ -125,19 +117,21 @@ For each grade, the bars are sorted with the biggest on the left.
 Hover over the leftmost bar to see which crag has the most climbs for each grade. :point_down: 
 ''')
 
+# Count the climbs here, so that only the counts are sent to the browser rather than every selected climb
+df_counts = df.groupby(['grade', 'crag'], observed=True).size().reset_index(name='climbs')
+
 c = alt.Chart(
-    df,
+    df_counts,
     title=alt.Title(
         "Number of climbs at each grade by crag",
     )
 ).mark_bar(
 ).encode(
-    x=alt.X(aggregate='count', type='quantitative').title('number of climbs'),
-    y=alt.Y('grade'),
+    x=alt.X('climbs:Q').title('number of climbs'),
+    y=alt.Y('grade:N', sort=grade_list),
     color=alt.Color('crag:N', legend=alt.Legend(symbolLimit=50)),
     order=alt.Order(
-        field='x',  # Sort the segments of the bars by this field
-        aggregate='count',
+        'climbs:Q',  # Sort the segments of the bars by this field
         sort='descending'
     )
 ).configure_title(
@@ -154,36 +148,35 @@ difficulty.
 :point_down: Hover over the bars to see details about the climb. Clicking on a bar takes you to the relevant UKC page.
 ''')
 
-tabs = st.tabs(grade_list)  # Assume tabs returned in same order as grade_list
-for tab, tab_name in zip(tabs, grade_list):
-    df_climbs_at_grade = df_unfiltered.loc[df_unfiltered['grade'] == tab_name]
-    df_climbs_at_grade = df_climbs_at_grade.sort_values('logs').tail(30)
-    poll_grade_sort_order = sorted(df_climbs_at_grade['poll_grade'].unique().tolist(), key=poll_grade_sort_key)
-
-    with (tab):
-        c = alt.Chart(
-            df_climbs_at_grade
-        ).mark_bar(
-        ).encode(
-            x=alt.X('name:N', sort='-y').title(None),
-            y=alt.Y('logs:Q'),
-            color='stars:N',
-            tooltip=['name:N', 'logs:Q', 'stars:N', 'crag:N', 'desc:N'],
-            href='url'
-        ).facet(
-            column=alt.Column('poll_grade:N', sort=poll_grade_sort_order, title=None),
-            title='Top 30 most logged climbs at grade by difficulty'
-        ).resolve_scale(
-            x='independent'
-        )
-
-        c['usermeta'] = {
-            'embedOptions': {
-                'loader': {'target': '_blank'}
-            }
-        }
-
-        st.altair_chart(c, use_container_width=True)
+# Only the chart for the selected grade is built, from leaderboards computed once per area
+leaderboards = store.leaderboards(area)
+grade = st.radio('Grade', options=grade_list, horizontal=True, label_visibility='collapsed')
+df_climbs_at_grade, poll_grade_sort_order = leaderboards[grade]
+
+c = alt.Chart(
+    # Only the columns the chart uses
+    df_climbs_at_grade[['name', 'url', 'logs', 'stars', 'crag', 'desc', 'poll_grade']]
+).mark_bar(
+).encode(
+    x=alt.X('name:N', sort='-y').title(None),
+    y=alt.Y('logs:Q'),
+    color='stars:N',
+    tooltip=['name:N', 'logs:Q', 'stars:N', 'crag:N', 'desc:N'],
+    href='url'
+).facet(
+    column=alt.Column('poll_grade:N', sort=poll_grade_sort_order, title=None),
+    title='Top 30 most logged climbs at grade by difficulty'
+).resolve_scale(
+    x='independent'
+)
+
+c['usermeta'] = {
+    'embedOptions': {
+        'loader': {'target': '_blank'}
+    }
+}
+
+st.altair_chart(c, use_container_width=True)
 
 
 st.markdown('''
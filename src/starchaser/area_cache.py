@@ -0,0 +1,127 @@
+import logging
+import os
+import pandas as pd
+import time
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from threading import Lock
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class AreaCache:
+    """
+    Climb data for each area, shared by every session of the dashboard process.
+
+    Data older than `ttl` is still returned, and is replaced by a background refresh, so that sessions viewing an area
+    never wait for it to be reloaded. Only the `max_areas` most recently used areas are kept. With a `snapshot_dir`,
+    each area loaded is also saved there as Parquet and read back after a restart instead of being loaded again.
+
+    DataFrames are shared between sessions, so they must not be modified in place.
+    """
+
+    def __init__(self, ttl: timedelta = timedelta(hours=1), max_areas: int = 8, snapshot_dir: str = None):
+        self.ttl = ttl.total_seconds()
+        self.max_areas = max_areas
+        self.snapshot_dir = snapshot_dir
+        if snapshot_dir:
+            os.makedirs(snapshot_dir, exist_ok=True)
+
+        self.entries = OrderedDict()  # area => (df, time loaded), least recently used first
+        self.lock = Lock()
+        self.load_locks = dict()  # area => lock held while the area is loaded into an empty cache, until it's cached
+        self.refreshing = set()  # Areas being refreshed in the background
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='area-cache')
+
+    def get(self, area: str, load: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """
+        Return the climb data for an area, calling `load` if it isn't cached. If the data has expired it's returned
+        anyway and `load` is called in the background to replace it.
+        """
+        with self.lock:
+            entry = self.entries.get(area)
+            if entry is None:
+                load_lock = self.load_locks.setdefault(area, Lock())
+
+        if entry is None:
+            # Sessions that want an area at the same time wait for one load
+            with load_lock:
+                with self.lock:
+                    entry = self.entries.get(area)
+                if entry is None:
+                    entry = self._read_snapshot(area) or self._load(area, load)
+                    with self.lock:
+                        self._put(area, entry)
+                        # Later sessions find the entry, and one waiting on this lock checks for it first
+                        self.load_locks.pop(area, None)
+
+        with self.lock:
+            # A background refresh may have replaced the entry since it was read, and the newer entry is the one
+            # to return and check for expiry. If it has been evicted since, the entry read is still returned.
+            if area in self.entries:
+                entry = self.entries[area]
+                self.entries.move_to_end(area)
+            df, loaded_at = entry
+            if time.time() - loaded_at > self.ttl and area not in self.refreshing:
+                self.refreshing.add(area)
+                self.executor.submit(self._refresh, area, load)
+        return df
+
+    def _put(self, area, entry):
+        self.entries[area] = entry
+        self.entries.move_to_end(area)
+        while len(self.entries) > self.max_areas:
+            evicted, _ = self.entries.popitem(last=False)
+            logger.info(f'Evicted {evicted} from the area cache')
+
+    def _refresh(self, area, load):
+        try:
+            entry = self._load(area, load)
+            with self.lock:
+                self._put(area, entry)
+        except Exception:
+            # Keep serving the expired data, the next get will try again
+            logger.exception(f'Failed to refresh {area}')
+        finally:
+            with self.lock:
+                self.refreshing.discard(area)
+
+    def _load(self, area, load):
+        loaded_at = time.time()
+        df = load()
+        logger.info(f'Loaded {len(df.index)} climbs for {area}')
+
+        if self.snapshot_dir:
+            path = self._snapshot_path(area)
+            tmp_path = f'{path}.tmp'
+            try:
+                df.to_parquet(tmp_path, index=False)
+                os.replace(tmp_path, path)
+                os.utime(path, (loaded_at, loaded_at))
+            except Exception:
+                logger.exception(f'Failed to write snapshot {path}')
+        return df, loaded_at
+
+    def _read_snapshot(self, area):
+        """Return (df, time loaded) from the area's snapshot, or None if there isn't one"""
+        if not self.snapshot_dir:
+            return None
+
+        path = self._snapshot_path(area)
+        try:
+            loaded_at = os.path.getmtime(path)
+            df = pd.read_parquet(path)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logger.exception(f'Failed to read snapshot {path}')
+            return None
+
+        logger.info(f'Read {len(df.index)} climbs for {area} from {path}')
+        return df, loaded_at
+
+    def _snapshot_path(self, area):
+        return os.path.join(self.snapshot_dir, f'{area}.parquet')
@@ -0,0 +1,316 @@
+import numpy as np
+import pandas as pd
+import sqlite3
+import threading
+
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from starchaser.grades import grade_sort_key, poll_grade_sort_key
+from typing import Callable
+
+# Columns of the climbs table, as written by the scraper, and their SQL types
+CLIMB_COLUMNS = {
+    'name': 'TEXT',
+    'url': 'TEXT',
+    'grade': 'TEXT',
+    'stars': 'INTEGER',
+    'logs': 'INTEGER',
+    'poll_grade': 'TEXT',
+    'poll_diff': 'REAL',
+    'crag': 'TEXT',
+    'buttress': 'TEXT',
+    'desc': 'TEXT',
+    'symbols': 'TEXT',
+    'approach_time': 'INTEGER',
+    'rocktype': 'TEXT',
+    'aspect': 'TEXT',
+}
+
+
+def grade_range(grades: list, min_grade: str = None, max_grade: str = None) -> tuple[int, int]:
+    """
+    Return the positions (low, high) in grades, sorted by grade_sort_key, of the grades from min_grade to max_grade.
+    Either may be None for no limit, and needn't be in grades.
+    """
+    keys = [grade_sort_key(grade) for grade in grades]
+    low = bisect_left(keys, grade_sort_key(min_grade)) if min_grade is not None else 0
+    high = bisect_right(keys, grade_sort_key(max_grade)) if max_grade is not None else len(grades)
+    return low, max(low, high)
+
+
+def grade_leaderboards(df: pd.DataFrame, n: int) -> dict:
+    """
+    Return {grade: (climbs, poll grades)} in grade_sort_key order, with the n most logged climbs at each grade, fewest
+    logs first, and their poll grades in poll_grade_sort_key order. Climbs with the same logs keep their order in df,
+    the last are kept.
+    """
+    top = df.sort_values('logs', kind='stable').groupby('grade', observed=True, sort=False).tail(n)
+    by_grade = sorted(top.groupby('grade', observed=True, sort=False), key=lambda item: grade_sort_key(item[0]))
+    return {grade: (climbs, sorted(climbs['poll_grade'].unique().tolist(), key=poll_grade_sort_key))
+            for grade, climbs in by_grade}
+
+
+class ClimbStore:
+    """
+    Climb data for the dashboard. Filters are passed to the store, so a store backed by a database only returns the
+    matching climbs. Grades are sorted and compared by difficulty, in grade_sort_key order, as on the dashboard's grade
+    slider.
+
+    Climbs are labelled by row ids that don't change until the area's climbs change. Data derived from all of an
+    area's climbs, e.g. leaderboards, is kept by `cached` until then too.
+    """
+
+    def __init__(self, max_cached: int = 64):
+        self.max_cached = max_cached
+        self.cache = OrderedDict()  # (area, key) => (area version, value), least recently used first
+        self.cache_lock = threading.Lock()
+
+    def version(self, area: str) -> int:
+        """Return a number that changes whenever the climbs in an area change"""
+        raise NotImplementedError
+
+    def cached(self, area: str, key, compute: Callable[[], object], version: int = None):
+        """
+        Return compute(), cached under key until the area's climbs change. version is the version of the climbs that
+        compute uses, the current version by default.
+        """
+        if version is None:
+            version = self.version(area)
+        with self.cache_lock:
+            cached_version, value = self.cache.get((area, key), (None, None))
+        # Sessions that miss at the same time each compute the value, rather than holding the lock while they do
+        if cached_version != version:
+            value = compute()
+
+        with self.cache_lock:
+            # A session that saw newer climbs may have cached its value while this one computed
+            cached_version, _ = self.cache.get((area, key), (None, None))
+            if cached_version is None or cached_version <= version:
+                self.cache[area, key] = version, value
+            self.cache.move_to_end((area, key))
+            while len(self.cache) > self.max_cached:
+                self.cache.popitem(last=False)
+        return value
+
+    def summary(self, area: str) -> tuple[int, list, list]:
+        """Return the number of climbs in an area, and its sorted crags and grades"""
+        raise NotImplementedError
+
+    def climbs(self, area: str, crags: list = None, min_grade: str = None, max_grade: str = None,
+               stars: list = None) -> pd.DataFrame:
+        """Return the climbs in an area that match all of the filters given"""
+        raise NotImplementedError
+
+    def leaderboards(self, area: str, n: int = 30) -> dict:
+        """Return the most logged climbs at each grade in an area, see grade_leaderboards"""
+        return self.cached(area, ('leaderboards', n), lambda: grade_leaderboards(self.climbs(area), n))
+
+
+class FilterIndex:
+    """
+    An area's climbs with bitmaps of the rows for each crag, grade and star rating, built once when the area is
+    loaded. Filtering is then a few bitwise operations on packed bits, rather than string comparisons over every row.
+
+    crag and grade become ordered categoricals, crags sorted as text and grades by grade_sort_key.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.crags = sorted(df['crag'].dropna().unique().tolist())
+        self.grades = sorted(df['grade'].dropna().unique().tolist(), key=grade_sort_key)
+        self.stars = sorted(df['stars'].dropna().unique().tolist())
+        self.df = df.assign(crag=pd.Categorical(df['crag'], categories=self.crags, ordered=True),
+                            grade=pd.Categorical(df['grade'], categories=self.grades, ordered=True))
+        self.n_rows = len(df.index)
+
+        self.crag_bitmaps = self._bitmaps(self.df['crag'].cat.codes.to_numpy(), len(self.crags))
+        star_codes = pd.Categorical(df['stars'], categories=self.stars).codes
+        self.star_bitmaps = self._bitmaps(star_codes, len(self.stars))
+
+        # Row i has the climbs with one of the first i grades, so a grade range is two bitmaps whatever its size
+        grade_codes = self.df['grade'].cat.codes.to_numpy()
+        below = np.zeros((len(self.grades) + 1, self.n_rows), dtype=bool)
+        for i in range(1, len(self.grades) + 1):
+            below[i] = (grade_codes >= 0) & (grade_codes < i)
+        self.grades_below = np.packbits(below, axis=1)
+
+    def _bitmaps(self, codes, n_values):
+        """Packed bitmap of the rows with each code, rows with code -1 (NaN) are in none"""
+        bitmaps = np.zeros((n_values, self.n_rows), dtype=bool)
+        known = codes >= 0
+        bitmaps[codes[known], np.flatnonzero(known)] = True
+        return np.packbits(bitmaps, axis=1)
+
+    @staticmethod
+    def _union(bitmaps, positions):
+        if not positions:
+            return np.zeros(bitmaps.shape[1], dtype=np.uint8)
+        return np.bitwise_or.reduce(bitmaps[positions], axis=0)
+
+    def select(self, crags: list = None, min_grade: str = None, max_grade: str = None,
+               stars: list = None) -> pd.DataFrame:
+        """Return the climbs that match all of the filters given"""
+        mask = np.full((self.n_rows + 7) // 8, 0xFF, dtype=np.uint8)
+        if crags is not None:
+            positions = {crag: i for i, crag in enumerate(self.crags)}
+            mask &= self._union(self.crag_bitmaps, [positions[crag] for crag in crags if crag in positions])
+        if stars is not None:
+            positions = {star: i for i, star in enumerate(self.stars)}
+            mask &= self._union(self.star_bitmaps, [positions[star] for star in stars if star in positions])
+        if min_grade is not None or max_grade is not None:
+            low, high = grade_range(self.grades, min_grade, max_grade)
+            mask &= self.grades_below[high] & ~self.grades_below[low]
+
+        return self.df.take(np.flatnonzero(np.unpackbits(mask, count=self.n_rows)))
+
+
+class DataFrameClimbStore(ClimbStore):
+    """
+    Store that loads a whole area as a DataFrame, e.g. from a Google Sheet, and filters it in memory with a
+    FilterIndex. The area's climbs change whenever load returns a new DataFrame for it.
+    """
+
+    def __init__(self, load: Callable[[str], pd.DataFrame], max_cached: int = 64):
+        super().__init__(max_cached)
+        self.load = load
+        self.loaded = dict()  # area => (DataFrame last loaded, version)
+        self.loaded_lock = threading.Lock()
+
+    def _load(self, area):
+        """Return the area's DataFrame and its version"""
+        df = self.load(area)
+        with self.loaded_lock:
+            loaded, version = self.loaded.get(area, (None, 0))
+            if loaded is not df:
+                version += 1
+                self.loaded[area] = df, version
+        return df, version
+
+    def version(self, area):
+        return self._load(area)[1]
+
+    def _index(self, area):
+        df, version = self._load(area)
+        return self.cached(area, 'index', lambda: FilterIndex(df), version)
+
+    def summary(self, area):
+        index = self._index(area)
+        return index.n_rows, index.crags, index.grades
+
+    def climbs(self, area, crags=None, min_grade=None, max_grade=None, stars=None):
+        return self._index(area).select(crags, min_grade, max_grade, stars)
+
+
+class SqliteClimbStore(ClimbStore):
+    """
+    Store in a SQLite database, written by the scrape CLI with --db. Climbs of every area are in one table, indexed
+    for each of the dashboard's filters. grade_rank is the position of the climb's grade in its area's grades sorted by
+    grade_sort_key, which grade ranges are compared on.
+    """
+
+    def __init__(self, db_path: str, max_cached: int = 64):
+        super().__init__(max_cached)
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def _connect(self):
+        with self.lock:
+            if self.connection is None:
+                self.connection = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True, check_same_thread=False)
+            return self.connection
+
+    def _query(self, sql, params=(), index_col=None):
+        connection = self._connect()
+        with self.lock:
+            return pd.read_sql_query(sql, connection, params=params, index_col=index_col)
+
+    def summary(self, area):
+        connection = self._connect()
+        with self.lock:
+            n_climbs, = connection.execute('SELECT COUNT(*) FROM climbs WHERE area = ?', (area,)).fetchone()
+            crags = [crag for crag, in connection.execute(
+                'SELECT DISTINCT crag FROM climbs WHERE area = ? ORDER BY crag', (area,))]
+            grades = self._grades(connection, area)
+        return n_climbs, crags, grades
+
+    @staticmethod
+    def _grades(connection, area):
+        return [grade for grade, in connection.execute(
+            'SELECT DISTINCT grade FROM climbs WHERE area = ? AND grade IS NOT NULL ORDER BY grade_rank', (area,))]
+
+    def climbs(self, area, crags=None, min_grade=None, max_grade=None, stars=None):
+        where = ['area = ?']
+        params = [area]
+        if crags is not None:
+            where.append(f'crag IN ({", ".join("?" * len(crags))})')
+            params += crags
+        if min_grade is not None or max_grade is not None:
+            connection = self._connect()
+            with self.lock:
+                grades = self._grades(connection, area)
+            where.append('grade_rank >= ? AND grade_rank < ?')
+            params += grade_range(grades, min_grade, max_grade)
+        if stars is not None:
+            where.append(f'stars IN ({", ".join("?" * len(stars))})')
+            params += stars
+
+        columns = ', '.join(f'"{column}"' for column in CLIMB_COLUMNS)
+        df = self._query(f'SELECT rowid AS row, {columns} FROM climbs WHERE {" AND ".join(where)} ORDER BY rowid',
+                         params, index_col='row')
+        df.index.name = None
+        return df
+
+    def version(self, area):
+        connection = self._connect()
+        with self.lock:
+            # Changes when the scraper writes to the database
+            version, = connection.execute('PRAGMA data_version').fetchone()
+        return version
+
+    def leaderboards(self, area, n=30):
+        def top_climbs():
+            columns = ', '.join(f'"{column}"' for column in CLIMB_COLUMNS)
+            df = self._query(f'SELECT {columns} FROM (SELECT *, ROW_NUMBER() OVER '
+                             f'(PARTITION BY grade ORDER BY logs DESC, rowid DESC) AS rank, rowid AS row '
+                             f'FROM climbs WHERE area = ?) WHERE rank <= ? ORDER BY row', (area, n))
+            return grade_leaderboards(df, n)
+
+        return self.cached(area, ('leaderboards', n), top_climbs)
+
+    def write_area(self, area: str, df: pd.DataFrame) -> None:
+        """Replace the climbs of an area with the climbs in df, in one transaction"""
+        rows = df[list(CLIMB_COLUMNS)].astype(object)
+        rows = rows.where(rows.notna(), None).itertuples(index=False)
+
+        definitions = ', '.join(f'"{column}" {sql_type}' for column, sql_type in CLIMB_COLUMNS.items())
+        columns = ', '.join(f'"{column}"' for column in ['area', *CLIMB_COLUMNS])
+        placeholders = ', '.join('?' * (len(CLIMB_COLUMNS) + 1))
+        connection = sqlite3.connect(self.db_path, timeout=60)
+        try:
+            # WAL lets the dashboard keep reading while an area is written
+            connection.execute('PRAGMA journal_mode = WAL')
+            with connection:
+                connection.execute(f'CREATE TABLE IF NOT EXISTS climbs (area TEXT NOT NULL, {definitions}, '
+                                   f'grade_rank INTEGER)')
+                if 'grade_rank' not in [row[1] for row in connection.execute('PRAGMA table_info(climbs)')]:
+                    # Written before grades were ranked, rank the grades of every area already in the database
+                    connection.execute('ALTER TABLE climbs ADD COLUMN grade_rank INTEGER')
+                    for other_area, in connection.execute('SELECT DISTINCT area FROM climbs').fetchall():
+                        self._rank_grades(connection, other_area)
+                for column in ['crag', 'grade', 'grade_rank', 'stars']:
+                    connection.execute(f'CREATE INDEX IF NOT EXISTS climbs_area_{column} ON climbs (area, {column})')
+                connection.execute('DELETE FROM climbs WHERE area = ?', (area,))
+                connection.executemany(f'INSERT INTO climbs ({columns}) VALUES ({placeholders})',
+                                       ((area, *row) for row in rows))
+                self._rank_grades(connection, area)
+                # Statistics for the query planner to pick the most selective index for each query
+                connection.execute('ANALYZE climbs')
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _rank_grades(connection, area):
+        grades = [grade for grade, in connection.execute(
+            'SELECT DISTINCT grade FROM climbs WHERE area = ? AND grade IS NOT NULL', (area,))]
+        connection.executemany('UPDATE climbs SET grade_rank = ? WHERE area = ? AND grade = ?',
+                               ((rank, area, grade) for rank, grade in enumerate(sorted(grades, key=grade_sort_key))))
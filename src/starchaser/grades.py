@@ -0,0 +1,56 @@
+import re
+
+
+def poll_grade_sort_key(x):
+    tokens = x.split()
+
+    if len(tokens) != 2:  # e.g. 'project' or '?'
+        return '9d', '0'
+
+    modifier = tokens[0]
+    grade = tokens[1]
+
+    if not grade[0].isdigit():  # e.g. 'No votes'
+        return '9d', '0'
+
+    # Low 6a, Mid 6a, High 6a => 6a0, 6a1, 6a2
+    m = {
+        'Low': '0',
+        'Mid': '1',
+        'High': '2'
+    }
+    return grade, m[modifier]
+
+
+# UK adjectival grades below E1, easiest first
+UK_ADJECTIVAL_GRADES = ['M', 'D', 'HD', 'VD', 'HVD', 'MS', 'S', 'HS', 'MVS', 'VS', 'HVS']
+
+_french_grade_re = re.compile(r'([fF]?)(\d+)([a-cA-C]?)(\+?)')
+_uk_e_grade_re = re.compile(r'E(\d+)')
+_uk_tech_grade_re = re.compile(r'\d[a-c]?')
+_v_grade_re = re.compile(r'V(\d+|B)')
+
+
+def grade_sort_key(grade: str) -> tuple:
+    """
+    Key that sorts grade names in order of difficulty within each grading scale, e.g. 6a < 6a+ < 6b, VS 4c < HVS 5a
+    < E1 5b, f6A < f6A+ and VB < V2 < V10. Grades of different scales are grouped by scale, in the order French sport,
+    Font, UK trad, V grades, then anything else (e.g. 'project') as text.
+    """
+    tokens = str(grade).split()
+    if len(tokens) == 1 and (match := _french_grade_re.fullmatch(tokens[0])):
+        prefix, number, letter, plus = match.groups()
+        return 1 if prefix else 0, int(number), letter.lower(), len(plus), ''
+
+    # An adjectival grade, optionally followed by a technical grade e.g. 'HVS 5a'
+    if 1 <= len(tokens) <= 2 and (len(tokens) == 1 or _uk_tech_grade_re.fullmatch(tokens[1])):
+        tech = tokens[1] if len(tokens) == 2 else ''
+        if tokens[0] in UK_ADJECTIVAL_GRADES:
+            return 2, UK_ADJECTIVAL_GRADES.index(tokens[0]), tech, 0, ''
+        if match := _uk_e_grade_re.fullmatch(tokens[0]):
+            return 2, len(UK_ADJECTIVAL_GRADES) + int(match[1]), tech, 0, ''
+
+    if len(tokens) == 1 and (match := _v_grade_re.fullmatch(tokens[0])):
+        return 3, -1 if match[1] == 'B' else int(match[1]), '', 0, ''
+
+    return 4, 0, '', 0, str(grade)
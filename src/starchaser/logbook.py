@@ -0,0 +1,63 @@
+import hashlib
+import io
+import numpy as np
+import pandas as pd
+import re
+import unicodedata
+
+# Columns of a UKC logbook (DLOG) file
+LOGBOOK_NAME_COLUMN = 'Name'
+LOGBOOK_CRAG_COLUMNS = ('crag', 'crag name')  # Any case
+
+_COMBINING_RE = re.compile('[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]')
+_NON_WORD_RE = re.compile(r'[\W_]+')
+
+
+def normalize_name(name) -> str:
+    """Name of a climb or crag for matching, ignoring case, accents and punctuation, '' if it isn't text"""
+    if not isinstance(name, str):
+        return ''
+    if not name.isascii():
+        name = _COMBINING_RE.sub('', unicodedata.normalize('NFKD', name))
+    return _NON_WORD_RE.sub(' ', name.casefold()).strip()
+
+
+class Logbook:
+    """
+    Climbs in a user's UKC logbook, indexed by normalised name, and by crag too if the logbook has a crag column
+    """
+
+    def __init__(self, df_logs: pd.DataFrame, digest: str = ''):
+        self.digest = digest
+        self.n_logs = len(df_logs.index)
+
+        crag_column = next((column for column in df_logs.columns if column.lower() in LOGBOOK_CRAG_COLUMNS), None)
+        entries = pd.DataFrame({
+            'name': df_logs[LOGBOOK_NAME_COLUMN].map(normalize_name),
+            'crag': df_logs[crag_column].map(normalize_name) if crag_column else '',
+        })
+        self.entries = entries.loc[entries['name'] != ''].drop_duplicates(ignore_index=True)
+
+    @classmethod
+    def read(cls, content: bytes, digest: str = None) -> 'Logbook':
+        """Parse the content of a DLOG file, the logbook's digest identifies the content"""
+        return cls(pd.read_csv(io.BytesIO(content)), digest or cls.content_digest(content))
+
+    @staticmethod
+    def content_digest(content: bytes) -> str:
+        return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+    def match(self, names: pd.Series, crags: pd.Series) -> np.ndarray:
+        """
+        Return a mask of the climbs that are in the logbook, given the climbs' normalised names and crags. A climb
+        matches a logged climb with the same name at the same crag, or with the same name if the logged crag is
+        missing or isn't one of the climbs' crags, e.g. because it's named differently.
+        """
+        names = names.reset_index(drop=True)
+        crags = crags.reset_index(drop=True)
+        with_crag = (self.entries['crag'] != '') & self.entries['crag'].isin(set(crags))
+        by_name = names.isin(self.entries.loc[~with_crag, 'name'])
+
+        logged = self.entries.loc[with_crag]
+        by_crag = (names + '\x1f' + crags).isin(logged['name'] + '\x1f' + logged['crag'])
+        return (by_name | by_crag).to_numpy()
@@ -1,6 +1,12 @@
+import os
 import pandas as pd
 import streamlit as st
 
+from datetime import timedelta
+from starchaser.area_cache import AreaCache
+from starchaser.datastore import ClimbStore, DataFrameClimbStore, SqliteClimbStore
+from starchaser.grades import poll_grade_sort_key  # noqa: F401
+from starchaser.logbook import Logbook, normalize_name
 from streamlit_gsheets import GSheetsConnection
 
 
@@ -33,44 +39,79 @@ class GuidebookInfo:
         return GuidebookInfo.data[area_name]['display_name']
 
 
+# Climb data is shared by all sessions, and reloaded from the sheet in the background once it's older than this
+CLIMB_DATA_TTL = timedelta(hours=1)
+
+# Directory for Parquet snapshots of the climb data, so that a restarted dashboard doesn't read the sheets again
+CLIMB_SNAPSHOT_DIR = os.environ.get('STARCHASER_SNAPSHOT_DIR')
+
+
+@st.cache_resource
+def get_area_cache() -> AreaCache:
+    """The AreaCache shared by every session"""
+    return AreaCache(CLIMB_DATA_TTL, max_areas=len(GuidebookInfo.data), snapshot_dir=CLIMB_SNAPSHOT_DIR)
+
+
 def get_climb_data(area):
-    if 'df' not in st.session_state or area != st.session_state.area:
-        conn = st.connection(area, type=GSheetsConnection)
-        df = conn.read()
-        st.session_state.df = df
-        st.session_state.area = area
-    return st.session_state.df
+    """Return the climb data for an area. It's shared with other sessions, so it must not be modified in place."""
+    conn = st.connection(area, type=GSheetsConnection)
+    # The area cache decides when to read the sheet again, so skip the connection's own cache
+    return get_area_cache().get(area, lambda: conn.read(ttl=0))
 
 
-def get_logbook_data(logbook_file: str = ''):
-    if logbook_file:
-        if 'logbook_file' not in st.session_state or logbook_file != st.session_state.logbook_file:
-            df_logs = pd.read_csv(logbook_file)
-            st.session_state.logbook_file = logbook_file
-            st.session_state.df_logs = df_logs
+# SQLite database written by the scraper with --db. Without one, climbs are read from the Google Sheets.
+CLIMB_DB = os.environ.get('STARCHASER_DB')
 
-    if 'df_logs' not in st.session_state:
-        return None, None
 
-    return st.session_state.df_logs, st.session_state.logbook_file
+@st.cache_resource
+def get_climb_store() -> ClimbStore:
+    """The ClimbStore shared by every session"""
+    if CLIMB_DB:
+        return SqliteClimbStore(CLIMB_DB)
+    return DataFrameClimbStore(get_climb_data)
 
 
-def poll_grade_sort_key(x):
-    tokens = x.split()
+def read_climbs(path: str, columns: list = None) -> pd.DataFrame:
+    """
+    Read climbs written by the scraper in any of its output formats. Parquet and feather files are read a column at a
+    time, so only the columns asked for are loaded.
+    """
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=columns)
+    if path.endswith('.feather'):
+        return pd.read_feather(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
 
-    if len(tokens) != 2:  # e.g. 'project' or '?'
-        return '9d', '0'
 
-    modifier = tokens[0]
-    grade = tokens[1]
+@st.cache_resource(max_entries=32)
+def read_logbook(digest: str, _content: bytes) -> Logbook:
+    """Parse a logbook, once for all sessions that upload the same content"""
+    return Logbook.read(_content, digest)
 
-    if not grade[0].isdigit():  # e.g. 'No votes'
-        return '9d', '0'
 
-    # Low 6a, Mid 6a, High 6a => 6a0, 6a1, 6a2
-    m = {
-        'Low': '0',
-        'Mid': '1',
-        'High': '2'
-    }
-    return grade, m[modifier]
+def get_logbook_data(logbook_file=None):
+    """Return the uploaded logbook and its file name, or else those uploaded earlier in the session, or None, None"""
+    if logbook_file and logbook_file.file_id != st.session_state.get('logbook_file_id'):
+        content = logbook_file.getvalue()
+        st.session_state.logbook = read_logbook(Logbook.content_digest(content), content), logbook_file.name
+        st.session_state.logbook_file_id = logbook_file.file_id
+
+    return st.session_state.get('logbook', (None, None))
+
+
+def get_logbook_matches(store: ClimbStore, area: str, logbook: Logbook) -> pd.Index:
+    """
+    Return the row ids of the climbs in an area that are in the logbook, matched once per logbook and area data, so
+    that the climbs returned by the store that are in the logbook are `df.index.isin(matches)`
+    """
+    def normalized_climbs():
+        climbs = store.climbs(area)
+        # Crags repeat, so are normalised once per crag as categories
+        crags = climbs['crag'].astype('category').map(normalize_name).astype(object)
+        return climbs.index, climbs['name'].astype(object).map(normalize_name), crags
+
+    def match():
+        rows, names, crags = store.cached(area, 'normalized climbs', normalized_climbs)
+        return rows[logbook.match(names, crags)]
+
+    return store.cached(area, ('logbook', logbook.digest), match)
@@ -0,0 +1,9 @@
+import pytest
+
+from tests.server import UKCServer
+
+
+@pytest.fixture
+def ukc_server():
+    with UKCServer() as server:
+        yield server
@@ -0,0 +1,94 @@
+import json
+import random
+import re
+
+from pathlib import Path
+
+DATA_DIR = Path(__file__).parent / 'data' / 'ukc'
+GUIDEBOOK_TEMPLATE = DATA_DIR / 'logbook' / 'books' / 'test_guide-1' / 'index.html'
+CRAG_TEMPLATE = DATA_DIR / 'logbook' / 'crags' / 'las_encantadas-2485' / 'index.html'
+CLIMB_TEMPLATE = DATA_DIR / 'logbook' / 'crags' / 'las_encantadas-2485' / 'redders-112975.html'
+
+CRAG_ID_START = 900000
+CLIMB_ID_START = 9000000
+
+# Descriptions as they appear in table_data, from empty to long with markup
+DESCRIPTIONS = [
+    '',
+    '<br>',
+    'Rockfax DescriptionClimb the line of bolts; lower off at the chain.',
+    '<p><strong>UKClimbing Description</strong></p><p>Sustained tufa climbing &amp; a "spicy" finish.</p>',
+    '<p>' + 'Steep pulls between good pockets, then a long reach to the belay. ' * 6 + '</p>',
+]
+
+_crag_re = re.compile(r'/logbook/crags/bench_crag_(\d+)-(\d+)/$')
+_climb_re = re.compile(r'/logbook/crags/bench_crag_(\d+)-\d+/bench_climb_(\d+)_(\d+)-(\d+)$')
+_guidebook_rows_re = re.compile(r'<tbody>.*</tbody>', re.DOTALL)
+_table_data_re = re.compile(r'table_data = \[.*?\],\n', re.DOTALL)
+_poll_votes_re = re.compile(r'data-n="\d+"')
+
+
+class SyntheticCorpus:
+    """
+    A guidebook of n_crags crags with n_climbs climbs each, made from the saved pages in tests/data/ukc so that it has
+    their structure. Pages are the same for the same seed. Any guidebook url that isn't saved is this guidebook.
+    """
+
+    def __init__(self, n_crags: int = 10, n_climbs: int = 20, seed: int = 0):
+        self.n_crags = n_crags
+        self.n_climbs = n_climbs
+        self.seed = seed
+        self.guidebook_template = GUIDEBOOK_TEMPLATE.read_text()
+        self.crag_template = CRAG_TEMPLATE.read_text()
+        self.climb_template = CLIMB_TEMPLATE.read_text()
+
+    def crag_path(self, n_crag: int) -> str:
+        return f'/logbook/crags/bench_crag_{n_crag}-{CRAG_ID_START + n_crag}/'
+
+    def climb_paths(self) -> list[str]:
+        return [self.crag_path(n_crag) + self._climb(n_crag, n_climb)['slug']
+                for n_crag in range(self.n_crags) for n_climb in range(self.n_climbs)]
+
+    def page(self, path: str) -> bytes:
+        """Return the page at path, or None if it isn't in the corpus"""
+        path = path.split('?')[0]
+        if path.startswith('/logbook/books/') and path.endswith('/'):
+            return self._guidebook().encode()
+
+        match = _crag_re.fullmatch(path)
+        if match and int(match[1]) < self.n_crags:
+            return self._crag(int(match[1])).encode()
+
+        match = _climb_re.fullmatch(path)
+        if match and int(match[2]) < self.n_crags and int(match[3]) < self.n_climbs:
+            return self._climb_page(int(match[4])).encode()
+        return None
+
+    def _guidebook(self):
+        rows = ''.join(f'<tr><td><a href="{self.crag_path(n_crag).rstrip("/")}">Bench Crag {n_crag}</a></td>'
+                       f'<td>{self.n_climbs}</td><td>Limestone</td><td>{"NESW"[n_crag % 4]}</td></tr>\n'
+                       for n_crag in range(self.n_crags))
+        return _guidebook_rows_re.sub(lambda _: f'<tbody>\n{rows}</tbody>', self.guidebook_template)
+
+    def _climb(self, n_crag, n_climb):
+        climb_id = CLIMB_ID_START + n_crag * self.n_climbs + n_climb
+        rng = random.Random(f'{self.seed}-{climb_id}')
+        trad = rng.random() < 0.1
+        return {
+            'id': climb_id, 'name': f'Bench Climb {n_crag}-{n_climb}',
+            'slug': f'bench_climb_{n_crag}_{n_climb}-{climb_id}',
+            'grade': rng.randint(10, 12) if trad else rng.randint(30, 41), 'gradetype': 2 if trad else 3,
+            'techgrade': 0, 'stars': rng.randint(0, 3), 'logs': rng.randint(0, 500), 'height': 25,
+            'buttress_id': rng.choice([501, 502, 999]), 'desc': rng.choice(DESCRIPTIONS),
+            'symbols': rng.sample([1, 4, 9], rng.randint(0, 2)), 'is_project': 0, 'first_ascent': None,
+        }
+
+    def _crag(self, n_crag):
+        table_data = json.dumps([self._climb(n_crag, n_climb) for n_climb in range(self.n_climbs)],
+                                separators=(',', ':'))
+        page = _table_data_re.sub(lambda _: f'table_data = {table_data},\n', self.crag_template)
+        return page.replace('Las Encantadas', f'Bench Crag {n_crag}')
+
+    def _climb_page(self, climb_id):
+        rng = random.Random(f'{self.seed}-poll-{climb_id}')
+        return _poll_votes_re.sub(lambda _: f'data-n="{rng.choice([0, 0, 1, 2, 5, 12])}"', self.climb_template)
@@ -0,0 +1,94 @@
+import random
+import threading
+import time
+
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+DATA_DIR = Path(__file__).parent / 'data' / 'ukc'
+
+
+class UKCRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Serve saved UKC pages from tests/data/ukc
+    Guidebook and crag urls end with '/' and are served from index.html, climb urls are served from <slug>.html
+    Pages that aren't saved are served from the server's corpus, if it has one
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, directory=str(DATA_DIR), **kwargs)
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.server.should_fail():
+            self.send_response(503)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        page = self.server.corpus.page(self.path) if self.server.corpus and not self.is_saved(self.path) else None
+        if page is None:
+            super().do_GET()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(page)))
+        self.end_headers()
+        self.wfile.write(page)
+
+    def translate_path(self, path):
+        local_path = super().translate_path(path)
+        if not path.split('?')[0].endswith('/') and not Path(local_path).exists():
+            local_path += '.html'
+        return local_path
+
+    def is_saved(self, path):
+        local_path = Path(self.translate_path(path))
+        return local_path.is_file() or (local_path / 'index.html').is_file()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class UKCServer(ThreadingHTTPServer):
+    """
+    Local stand-in for UKC
+    :param latency: Seconds to wait before answering each request
+    :param error_rate: Fraction of requests answered with 503 Service Unavailable (and Retry-After: 0)
+    :param corpus: Serves the pages that aren't saved in tests/data/ukc, e.g. a tests.corpus.SyntheticCorpus
+    :param seed: Seed for choosing the requests that fail
+    """
+    daemon_threads = True
+
+    def __init__(self, handler=UKCRequestHandler, latency: float = 0, error_rate: float = 0, corpus=None,
+                 seed: int = 0):
+        super().__init__(('127.0.0.1', 0), handler)
+        self.requests = []
+        self.latency = latency
+        self.error_rate = error_rate
+        self.corpus = corpus
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def should_fail(self) -> bool:
+        if not self.error_rate:
+            return False
+        with self._random_lock:
+            return self._random.random() < self.error_rate
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
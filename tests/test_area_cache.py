@@ -0,0 +1,139 @@
+import pandas as pd
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from threading import Event, Lock
+from starchaser.area_cache import AreaCache
+
+
+class Loader:
+    """Load function that counts calls and returns a new DataFrame each time"""
+
+    def __init__(self, release: Event = None):
+        self.calls = 0
+        self.release = release
+
+    def __call__(self):
+        self.calls += 1
+        if self.release is not None:
+            self.release.wait(5)
+        return pd.DataFrame({'name': ['Redders'], 'version': [self.calls]})
+
+
+class HookLock:
+    """Lock that calls hook, without the lock held, before it's acquired for the nth time"""
+
+    def __init__(self, n, hook):
+        self.lock = Lock()
+        self.n = n
+        self.hook = hook
+
+    def __enter__(self):
+        self.n -= 1
+        if self.n == 0:
+            self.hook()
+        return self.lock.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self.lock.__exit__(*exc_info)
+
+
+def test_shared_until_expired():
+    cache = AreaCache(ttl=timedelta(hours=1))
+    load = Loader()
+    df = cache.get('kalymnos', load)
+    assert cache.get('kalymnos', load) is df
+    assert load.calls == 1
+
+
+def test_concurrent_cold_load():
+    cache = AreaCache()
+    release = Event()
+    load = Loader(release)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(cache.get, 'kalymnos', load) for _ in range(4)]
+        time.sleep(0.1)
+        release.set()
+        results = [future.result() for future in futures]
+    assert load.calls == 1
+    assert all(df is results[0] for df in results)
+
+
+def test_background_refresh():
+    cache = AreaCache()
+    df = cache.get('kalymnos', Loader())
+    cache.ttl = 0
+
+    # The expired copy is returned straight away while the refresh waits
+    release = Event()
+    refresh = Loader(release)
+    assert cache.get('kalymnos', refresh) is df
+    assert cache.get('kalymnos', refresh) is df
+    release.set()
+    cache.executor.shutdown()
+    assert refresh.calls == 1
+    assert cache.entries['kalymnos'][0] is not df
+
+
+def test_refresh_not_overwritten():
+    cache = AreaCache(ttl=timedelta(hours=1))
+    df = cache.get('kalymnos', Loader())
+    cache.entries['kalymnos'] = (df, time.time() - 7200)
+    refresh = Loader()
+
+    # A refresh that finishes after get reads the expired entry, but before get checks it
+    cache.lock = HookLock(2, lambda: cache._refresh('kalymnos', refresh))
+    fresh = cache.get('kalymnos', refresh)
+    cache.executor.shutdown()
+    assert cache.entries['kalymnos'][0] is fresh
+    assert fresh['version'].tolist() == [1]
+    assert refresh.calls == 1
+
+
+def test_load_locks_pruned():
+    cache = AreaCache(max_areas=1)
+    for area in ['dorset', 'kalymnos', 'dorset']:
+        cache.get(area, Loader())
+    assert not cache.load_locks
+
+
+def test_failed_refresh_keeps_data():
+    def fail():
+        raise ConnectionError
+
+    cache = AreaCache()
+    df = cache.get('kalymnos', Loader())
+    cache.ttl = 0
+    assert cache.get('kalymnos', fail) is df
+    cache.executor.shutdown()
+    assert cache.entries['kalymnos'][0] is df
+    assert not cache.refreshing
+
+
+def test_evicts_least_recently_used():
+    cache = AreaCache(max_areas=2)
+    load = Loader()
+    cache.get('dorset', load)
+    cache.get('kalymnos', load)
+    cache.get('dorset', load)
+    cache.get('el-chorro', load)
+    assert list(cache.entries) == ['dorset', 'el-chorro']
+
+
+def test_snapshot(tmp_path):
+    load = Loader()
+    df = AreaCache(snapshot_dir=str(tmp_path)).get('kalymnos', load)
+    assert not list(tmp_path.glob('*.tmp'))
+
+    # A new process reads the snapshot rather than loading the area again
+    restarted = AreaCache(snapshot_dir=str(tmp_path)).get('kalymnos', load)
+    assert load.calls == 1
+    pd.testing.assert_frame_equal(restarted, df)
+
+    # An expired snapshot is used, and refreshed in the background
+    cache = AreaCache(ttl=timedelta(0), snapshot_dir=str(tmp_path))
+    pd.testing.assert_frame_equal(cache.get('kalymnos', load), df)
+    cache.executor.shutdown()
+    assert load.calls == 2
+    assert pd.read_parquet(tmp_path / 'kalymnos.parquet')['version'].tolist() == [2]
@@ -0,0 +1,80 @@
+import json
+import pandas as pd
+import pytest
+
+from click.testing import CliRunner
+from scrape.cli import guidebook_url, main
+from tests.corpus import SyntheticCorpus
+from tests.server import UKCServer
+
+
+@pytest.fixture
+def corpus_server():
+    with UKCServer(corpus=SyntheticCorpus(n_crags=2, n_climbs=3)) as server:
+        yield server
+
+
+def scrape(server, *args):
+    result = CliRunner().invoke(main, ['--area', 'dorset', '--base-url', server.url, '--rate', '1000',
+                                       '--max-rate', '1000', *args])
+    assert result.exit_code == 0, result.output
+    return result
+
+
+def test_guidebook_url():
+    assert guidebook_url('dorset') == 'https://www.ukclimbing.com/logbook/books/dorset-2348/'
+    assert guidebook_url('dorset', 'http://127.0.0.1:8000') == 'http://127.0.0.1:8000/logbook/books/dorset-2348/'
+
+
+def test_report(tmp_path, monkeypatch, corpus_server):
+    monkeypatch.chdir(tmp_path)
+    scrape(corpus_server)
+    n_climbs = len(pd.read_csv(tmp_path / 'data' / 'dorset.csv').index)
+
+    with open(tmp_path / 'data' / 'scrape-report.json') as f:
+        report = json.load(f)
+    assert report['areas'] == ['dorset']
+    assert report['counts']['downloaded'] == len(corpus_server.requests) == 1 + 2 + n_climbs
+    assert report['counts']['climbs_written'] == n_climbs
+    assert report['requests']['status_codes'] == {'200': 1 + 2 + n_climbs}
+    assert report['requests']['latency']['climb']['n'] == n_climbs
+    assert report['bytes']['downloaded'] > 0
+    assert all(stage['calls'] > 0 for stage in report['stages'].values())
+
+
+def test_unknown_grade_type(tmp_path, monkeypatch, corpus_server):
+    monkeypatch.chdir(tmp_path)
+    scrape(corpus_server)
+    n_requests = len(corpus_server.requests)
+
+    # Checked against the grade types saved by the first scrape, before anything is fetched
+    result = CliRunner().invoke(main, ['--area', 'dorset', '--base-url', corpus_server.url, '--grade-type', 'sprot'])
+    assert result.exit_code == 2
+    assert 'sprot' in result.output
+    assert len(corpus_server.requests) == n_requests
+
+
+def test_offline(tmp_path, monkeypatch, corpus_server):
+    monkeypatch.chdir(tmp_path)
+    scrape(corpus_server)
+    expected = (tmp_path / 'data' / 'dorset.csv').read_text()
+    n_requests = len(corpus_server.requests)
+
+    scrape(corpus_server, '--offline', '--report', 'offline-report.json')
+    assert (tmp_path / 'data' / 'dorset.csv').read_text() == expected
+    assert len(corpus_server.requests) == n_requests
+    with open(tmp_path / 'data' / 'offline-report.json') as f:
+        report = json.load(f)
+    assert report['requests']['n'] == 0
+    assert report['counts']['cached'] == n_requests
+
+    # Nothing is cached for another area
+    result = CliRunner().invoke(main, ['--area', 'kalymnos', '--base-url', corpus_server.url, '--offline'])
+    assert result.exit_code != 0
+    assert len(corpus_server.requests) == n_requests
+
+
+def test_profile(tmp_path, monkeypatch, corpus_server):
+    monkeypatch.chdir(tmp_path)
+    scrape(corpus_server, '--profile')
+    assert (tmp_path / 'data' / 'scrape-profile.prof').stat().st_size > 0
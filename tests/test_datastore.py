@@ -0,0 +1,239 @@
+import numpy as np
+import pandas as pd
+import pytest
+import sqlite3
+
+from scrape.output import CLIMB_SCHEMA
+from scrape.scrape import Scraper
+from starchaser.datastore import (CLIMB_COLUMNS, ClimbStore, DataFrameClimbStore, FilterIndex, SqliteClimbStore,
+                                  grade_leaderboards, grade_range, poll_grade_sort_key)
+from starchaser.grades import grade_sort_key
+from starchaser.utils import read_climbs
+
+GUIDEBOOK_PATH = '/logbook/books/test_guide-1/'
+
+
+@pytest.fixture
+def climbs(tmp_path, ukc_server):
+    s = Scraper(data_dir=str(tmp_path))
+    crags = s.scrape_guidebook_and_contents(ukc_server.url + GUIDEBOOK_PATH)
+    s.write_climbs(crags, 'climbs.csv')
+    s.write_climbs(crags, 'climbs.parquet', 'parquet')
+    return read_climbs(str(tmp_path / 'climbs.csv'))
+
+
+@pytest.fixture
+def store(tmp_path, climbs):
+    store = SqliteClimbStore(str(tmp_path / 'climbs.sqlite'))
+    store.write_area('dorset', climbs)
+    store.write_area('kalymnos', climbs.head(3))
+    return store
+
+
+def test_columns_match_scraper_output():
+    assert list(CLIMB_COLUMNS) == CLIMB_SCHEMA.names
+
+
+def test_summary(store, climbs):
+    expected = DataFrameClimbStore(lambda area: climbs).summary('dorset')
+    assert store.summary('dorset') == expected
+    assert store.summary('kalymnos')[0] == 3
+    assert store.summary('el-chorro') == (0, [], [])
+
+
+@pytest.mark.parametrize('filters', [
+    {},
+    {'crags': ['Las Encantadas']},
+    {'min_grade': '6b', 'max_grade': '7a'},
+    {'min_grade': '6b+', 'max_grade': '6b+'},
+    {'stars': [0, 2]},
+    {'crags': ['Las Encantadas', 'Odyssey'], 'min_grade': '6a', 'max_grade': '6c+', 'stars': [0, 1, 2, 3]},
+    {'crags': [], 'stars': []},
+])
+def test_filters_match_dataframe(store, climbs, filters):
+    expected = DataFrameClimbStore(lambda area: climbs).climbs('dorset', **filters)
+    assert store.climbs('dorset', **filters).to_csv(index=False) == expected.to_csv(index=False)
+
+
+def test_row_ids(store):
+    climbs = store.climbs('dorset')
+    filtered = store.climbs('dorset', stars=[2, 3])
+    assert filtered.index.isin(climbs.index).all()
+    assert (filtered['url'] == climbs.loc[filtered.index, 'url']).all()
+
+
+def test_write_area_replaces_area(store, climbs):
+    store.write_area('dorset', climbs.tail(2))
+    assert store.climbs('dorset').to_csv(index=False) == climbs.tail(2).to_csv(index=False)
+    assert len(store.climbs('kalymnos').index) == 3
+
+
+def test_filters_use_indexes(store):
+    connection = store._connect()
+    for column in ['crag', 'grade', 'stars']:
+        plan = connection.execute(f'EXPLAIN QUERY PLAN SELECT * FROM climbs WHERE area = ? AND {column} = ?',
+                                  ('dorset', 0)).fetchall()
+        assert f'climbs_area_{column}' in str(plan)
+
+
+def test_write_parquet_output(tmp_path, climbs):
+    # With categorical and integer columns, rather than the columns read from csv
+    store = SqliteClimbStore(str(tmp_path / 'parquet.sqlite'))
+    climbs = read_climbs(str(tmp_path / 'climbs.parquet'))
+    store.write_area('dorset', climbs)
+    assert store.climbs('dorset').to_csv(index=False) == climbs.to_csv(index=False)
+
+
+def filter_with_masks(df, crags=None, min_grade=None, max_grade=None, stars=None):
+    """The dashboard's original filtering, with a mask over the whole frame"""
+    mask = pd.Series(True, index=df.index)
+    if crags is not None:
+        mask &= df['crag'].isin(crags)
+    if min_grade is not None:
+        mask &= df['grade'] >= min_grade
+    if max_grade is not None:
+        mask &= df['grade'] <= max_grade
+    if stars is not None:
+        mask &= df['stars'].isin(stars)
+    return df.loc[mask]
+
+
+def test_filter_index_matches_masks():
+    rng = np.random.default_rng(0)
+    grades = ['5c', '6a', '6a+', '6b', '6b+', '6c', '7a', '7a+', '8a']
+    crags = [f'Crag {i}' for i in range(20)]
+    n = 1000
+    df = pd.DataFrame({
+        'name': [f'Climb {i}' for i in range(n)],
+        'crag': rng.choice(crags + [None], n),
+        'grade': rng.choice(grades + [None], n),
+        'stars': rng.integers(0, 4, n),
+    }, index=rng.permutation(n))
+    index = FilterIndex(df)
+    assert index.crags == sorted(crags)
+    assert index.grades == grades
+
+    for _ in range(200):
+        filters = {
+            'crags': list(rng.choice(crags + ['Unknown'], rng.integers(0, 4))) if rng.random() < 0.7 else None,
+            'min_grade': rng.choice(grades + ['6', '9a']) if rng.random() < 0.7 else None,
+            'max_grade': rng.choice(grades + ['6', '9a']) if rng.random() < 0.7 else None,
+            'stars': list(rng.choice(4, rng.integers(0, 4), replace=False)) if rng.random() < 0.7 else None,
+        }
+        selected = index.select(**filters)
+        expected = filter_with_masks(df, **filters)
+        pd.testing.assert_frame_equal(selected.astype(df.dtypes.to_dict()), expected)
+
+
+@pytest.mark.parametrize('filters, expected', [
+    ({'min_grade': 'V2', 'max_grade': 'V10'}, ['V2', 'V5', 'V10']),
+    ({'min_grade': 'VB'}, ['VB', 'V2', 'V5', 'V10']),
+    ({'max_grade': 'HVS 5a'}, ['S 4a', 'VS 4c', 'HVS 5a']),
+    ({'min_grade': 'HVS 5a', 'max_grade': 'E2 5c'}, ['HVS 5a', 'E1 5b', 'E2 5c']),
+    ({'min_grade': 'E1 5b', 'max_grade': 'E1 5b'}, ['E1 5b']),
+    ({'min_grade': 'V10', 'max_grade': 'V2'}, []),
+])
+def test_grades_filtered_by_difficulty(tmp_path, filters, expected):
+    grades = ['V10', 'HVS 5a', 'V2', 'E1 5b', 'S 4a', 'VB', 'E2 5c', 'V5', 'VS 4c']
+    df = pd.DataFrame({column: [None] * len(grades) for column in CLIMB_COLUMNS}).assign(
+        name=[f'Climb {i}' for i in range(len(grades))], grade=grades, crag='Crag', stars=0)
+    sqlite_store = SqliteClimbStore(str(tmp_path / 'grades.sqlite'))
+    sqlite_store.write_area('fontainebleau', df)
+    ordered = ['S 4a', 'VS 4c', 'HVS 5a', 'E1 5b', 'E2 5c', 'VB', 'V2', 'V5', 'V10']
+    for store in [DataFrameClimbStore(lambda area: df), sqlite_store]:
+        assert store.summary('fontainebleau')[2] == ordered
+        selected = store.climbs('fontainebleau', **filters)['grade'].tolist()
+        assert sorted(selected, key=grade_sort_key) == expected
+
+
+def test_grade_range():
+    grades = ['6a', '6a+', '6b', '7a']
+    assert grade_range(grades) == (0, 4)
+    assert grade_range(grades, '6a+', '6b') == (1, 3)
+    assert grade_range(grades, '6c', '9a') == (3, 4)
+    assert grade_range(grades, '7a', '6a') == (3, 3)
+
+
+def test_rank_added_to_existing_database(tmp_path, climbs):
+    # A database written before grades were ranked
+    db_path = str(tmp_path / 'unranked.sqlite')
+    store = SqliteClimbStore(db_path)
+    store.write_area('dorset', climbs)
+    store.write_area('kalymnos', climbs)
+    with sqlite3.connect(db_path) as connection:
+        connection.execute('DROP INDEX climbs_area_grade_rank')
+        connection.execute('ALTER TABLE climbs DROP COLUMN grade_rank')
+
+    store.write_area('kalymnos', climbs.head(3))
+    expected = DataFrameClimbStore(lambda area: climbs).climbs('dorset', min_grade='6b', max_grade='7a')
+    assert store.climbs('dorset', min_grade='6b', max_grade='7a').to_csv(index=False) == expected.to_csv(index=False)
+
+
+def test_filter_index_empty():
+    index = FilterIndex(pd.DataFrame({'crag': [], 'grade': [], 'stars': []}))
+    assert index.select(crags=['Crag'], min_grade='6a', max_grade='7a', stars=[1]).empty
+    assert index.select().empty
+
+
+def test_index_rebuilt_when_area_reloaded(climbs):
+    loaded = {'dorset': climbs}
+    store = DataFrameClimbStore(lambda area: loaded[area])
+    index = store._index('dorset')
+    assert store._index('dorset') is index
+
+    loaded['dorset'] = climbs.head(2)
+    assert store.summary('dorset')[0] == 2
+
+
+def test_index_of_frame_versioned(climbs):
+    # The area is reloaded after every call, the index is built from the frame whose version it's cached under
+    frames = iter([climbs, climbs.head(2), climbs.head(3)])
+    store = DataFrameClimbStore(lambda area: next(frames))
+    assert store._index('dorset').n_rows == len(climbs.index)
+    assert store.cache['dorset', 'index'][0] == 1
+
+
+def test_cached_keeps_newer_value():
+    class Store(ClimbStore):
+        def version(self, area):
+            return 1
+
+    store = Store()
+
+    def compute():
+        # Another session sees newer climbs and caches its value first
+        store.cached('dorset', 'key', lambda: 'new', version=2)
+        return 'old'
+
+    assert store.cached('dorset', 'key', compute) == 'old'
+    assert store.cache['dorset', 'key'] == (2, 'new')
+
+
+def test_leaderboards_match_per_grade(climbs):
+    # Enough climbs at each grade, with tied log counts, that some don't make the leaderboard
+    df = pd.concat([climbs] * 4, ignore_index=True).assign(logs=lambda df: df.index % 7)
+    boards = grade_leaderboards(df, 3)
+    assert list(boards) == sorted(df['grade'].unique().tolist(), key=grade_sort_key)
+    for grade, (top, poll_grades) in boards.items():
+        expected = df.loc[df['grade'] == grade].sort_values('logs', kind='stable').tail(3)
+        pd.testing.assert_frame_equal(top, expected)
+        assert poll_grades == sorted(expected['poll_grade'].unique().tolist(), key=poll_grade_sort_key)
+
+
+def test_leaderboards_match_between_stores(tmp_path, climbs):
+    df = pd.concat([climbs] * 4, ignore_index=True).assign(logs=lambda df: df.index % 7)
+    sqlite_store = SqliteClimbStore(str(tmp_path / 'leaderboards.sqlite'))
+    sqlite_store.write_area('dorset', df)
+    boards = sqlite_store.leaderboards('dorset', 3)
+    assert sqlite_store.leaderboards('dorset', 3) is boards
+
+    expected = DataFrameClimbStore(lambda area: df).leaderboards('dorset', 3)
+    assert list(boards) == list(expected)
+    for grade, (top, poll_grades) in boards.items():
+        assert top.to_csv(index=False) == expected[grade][0].to_csv(index=False)
+        assert poll_grades == expected[grade][1]
+
+    # Recomputed once the scraper writes the area again
+    sqlite_store.write_area('dorset', climbs)
+    assert sqlite_store.leaderboards('dorset', 3) is not boards
+    assert sum(len(top.index) for top, _ in sqlite_store.leaderboards('dorset', 3).values()) == len(climbs.index)
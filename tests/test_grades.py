@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from scrape.grades import GradeIndex
+
+GRADE_LIST = {
+    '3': {'36': {'name': '6b', 'score': 12}, '37': {'name': '6b+', 'score': 13}},
+    '2': {'10': {'name': 'VS 4c', 'score': 10}},
+}
+GRADE_TYPE_LIST = {'2': {'name': 'Trad'}, '3': {'name': 'Sport'}}
+
+
+def test_lookup():
+    grades = GradeIndex(GRADE_LIST, GRADE_TYPE_LIST)
+    assert grades.lookup_scores([3, 3, 2], [36, 37, 10]).tolist() == [12, 13, 10]
+    assert grades.lookup_names([3, 2], [37, 10]).tolist() == ['6b+', 'VS 4c']
+
+    # Unknown grade types and codes, including ones outside the arrays
+    assert np.isnan(grades.lookup_scores([2, 3, 9, 3], [36, 10, 36, -1])).all()
+    assert grades.lookup_names([2, 9], [36, 36]).tolist() == [None, None]
+    assert np.isnan(GradeIndex().lookup_scores([3], [36])).all()
+
+
+def test_lookup_during_rebuild(monkeypatch):
+    grades = GradeIndex(GRADE_LIST, GRADE_TYPE_LIST)
+    positions = GradeIndex._positions
+
+    # Another thread adds a grade type and code past the end of the arrays while a lookup is under way
+    def rebuild_then_positions(*args):
+        grades.add({'12': {'99': {'name': 'V10', 'score': 30}}})
+        return positions(*args)
+
+    monkeypatch.setattr(GradeIndex, '_positions', staticmethod(rebuild_then_positions))
+    scores = grades.lookup_scores([12, 3], [99, 36])
+    assert np.isnan(scores[0]) and scores[1] == 12
+    assert grades.lookup_names([12, 3], [99, 36]).tolist() == ['V10', '6b']
+
+
+def test_add(caplog):
+    grades = GradeIndex(GRADE_LIST)
+    assert not grades.changed
+
+    grades.add(GRADE_LIST)
+    assert not grades.changed
+
+    grades.add({'3': {'38': {'name': '6c', 'score': 14}}, '4': {'5': {'name': 'f6A', 'score': 20}}})
+    assert grades.changed
+    assert grades.lookup_names([3, 3, 4], [36, 38, 5]).tolist() == ['6b', '6c', 'f6A']
+
+    # A renamed grade replaces the saved one
+    grades.changed = False
+    grades.add({'3': {'36': {'name': '6b (new)', 'score': 12}}})
+    assert grades.changed
+    assert grades.lookup_names([3, 3], [36, 37]).tolist() == ['6b (new)', '6b+']
+    assert 'Grade 3/36 changed' in caplog.text
+
+
+def test_gradetype_ids():
+    grades = GradeIndex(GRADE_LIST, GRADE_TYPE_LIST)
+    assert grades.gradetype_ids(['sport']) == {3}
+    assert grades.gradetype_ids(['Trad', '3', 4]) == {2, 3, 4}
+    with pytest.raises(ValueError, match='bouldering'):
+        grades.gradetype_ids(['sport', 'bouldering'])
+
+    # Sport is known before any crag page lists it, or if a crag page doesn't
+    assert GradeIndex().gradetype_ids(['Sport', '2']) == {2, 3}
+    assert GradeIndex(GRADE_LIST, {'2': {'name': 'Trad'}}).gradetype_ids(['sport']) == {3}
+    with pytest.raises(ValueError):
+        GradeIndex().gradetype_ids(['trad'])
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / 'grades.json')
+    assert GradeIndex.load(path).grade_list == {}
+
+    grades = GradeIndex(GRADE_LIST, GRADE_TYPE_LIST)
+    grades.save(path)
+    loaded = GradeIndex.load(path)
+    assert loaded.grade_list == GRADE_LIST
+    assert loaded.gradetype_ids(['sport']) == {3}
+    assert loaded.lookup_scores([3], [37]).tolist() == [13]
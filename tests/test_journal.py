@@ -0,0 +1,35 @@
+from scrape.journal import Journal
+
+
+def test_resume_twice_after_incomplete_record(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = Journal(path)
+    journal.add_crag('crag-1', {'climbs': []})
+    journal.add_climb('climb-1', {'36,Mid 6b': 1})
+    journal.close()
+
+    # Killed while writing a record, then resumed, then killed again in the same way and resumed again
+    with open(path, 'a') as f:
+        f.write('{"type": "poll", "url": "climb-2", "da')
+    journal = Journal(path)
+    assert list(journal.climbs) == ['climb-1']
+    journal.add_climb('climb-3', {'36,Mid 6b': 2})
+    journal.close()
+
+    with open(path, 'a') as f:
+        f.write('{"type": "poll", "url": "climb-4"')
+    journal = Journal(path)
+    assert list(journal.crags) == ['crag-1']
+    assert journal.climbs == {'climb-1': {'36,Mid 6b': 1}, 'climb-3': {'36,Mid 6b': 2}}
+    journal.close()
+
+
+def test_resume_after_record_without_newline(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    with open(path, 'w') as f:
+        f.write('{"type": "poll", "url": "climb-1", "data": {}}')
+
+    journal = Journal(path)
+    journal.add_climb('climb-2', {})
+    journal.close()
+    assert list(Journal(path).climbs) == ['climb-1', 'climb-2']
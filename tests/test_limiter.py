@@ -0,0 +1,108 @@
+import pytest
+import time
+
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from requests import Response, Session
+from scrape.limiter import AdaptiveLimiterMixin, AdaptiveRateLimiter, get_retry_after
+from tests.server import UKCRequestHandler, UKCServer
+
+
+class LimitedSession(AdaptiveLimiterMixin, Session):
+    pass
+
+
+def scripted_handler(responses):
+    """Return a handler that replies to successive requests with (status, headers, delay) from responses"""
+    responses = iter(responses)
+
+    class ScriptedHandler(UKCRequestHandler):
+        def do_GET(self):
+            self.server.requests.append(self.path)
+            status, headers, delay = next(responses, (200, {}, 0))
+            time.sleep(delay)
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    return ScriptedHandler
+
+
+def test_limiter_paces_requests():
+    limiter = AdaptiveRateLimiter(rate=20, max_rate=20)
+    start = time.monotonic()
+    for _ in range(11):
+        limiter.wait()
+    assert time.monotonic() - start == pytest.approx(0.5, abs=0.1)
+
+
+def test_limiter_aimd():
+    limiter = AdaptiveRateLimiter(rate=5, min_rate=1, max_rate=8, increase=1, slow_latency=1)
+    for _ in range(100):
+        limiter.on_response(0.1, 200)
+    assert limiter.rate == 8
+
+    limiter.on_response(0.1, 429)
+    assert limiter.rate == 4
+    # A second throttled response straight after doesn't decrease the rate again
+    limiter.on_response(0.1, 503)
+    assert limiter.rate == 4
+
+    limiter.last_decrease = float('-inf')
+    limiter.on_response(1.5, 200)
+    assert limiter.rate == 2
+
+    for _ in range(10):
+        limiter.last_decrease = float('-inf')
+        limiter.on_response(0.1)
+    assert limiter.rate == 1
+
+
+def test_limiter_rejects_bad_limits():
+    with pytest.raises(ValueError):
+        AdaptiveRateLimiter(rate=20, max_rate=10)
+
+
+def test_get_retry_after():
+    response = Response()
+    assert get_retry_after(response) is None
+    response.headers['Retry-After'] = '2'
+    assert get_retry_after(response) == 2
+    now = datetime(2024, 6, 1, 12, tzinfo=timezone.utc)
+    response.headers['Retry-After'] = format_datetime(now + timedelta(seconds=30), usegmt=True)
+    assert get_retry_after(response, now) == 30
+
+
+def test_retry_after():
+    with UKCServer(scripted_handler([(429, {'Retry-After': '1'}, 0)])) as server:
+        session = LimitedSession(limiter=AdaptiveRateLimiter(rate=10, max_rate=10))
+        start = time.monotonic()
+        response = session.get(server.url + '/climb')
+        assert response.status_code == 200
+        assert len(server.requests) == 2
+        assert time.monotonic() - start >= 1
+        assert session.limiter.rate < 10
+
+
+def test_retries_with_backoff():
+    with UKCServer(scripted_handler([(503, {}, 0)] * 10)) as server:
+        session = LimitedSession(limiter=AdaptiveRateLimiter(rate=10, min_rate=1, max_rate=10), retries=2,
+                                 backoff=0.01)
+        response = session.get(server.url + '/climb')
+        assert response.status_code == 503
+        assert len(server.requests) == 3
+
+
+def test_backs_off_on_slow_responses():
+    with UKCServer(scripted_handler([(200, {}, 0.3)] * 3)) as server:
+        limiter = AdaptiveRateLimiter(rate=8, min_rate=1, max_rate=8, slow_latency=0.2)
+        session = LimitedSession(limiter=limiter)
+        for _ in range(3):
+            session.get(server.url + '/climb')
+        slow_rate = limiter.rate
+        assert slow_rate <= 2
+        for _ in range(3):
+            session.get(server.url + '/climb')
+        assert limiter.rate > slow_rate
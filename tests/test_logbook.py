@@ -0,0 +1,63 @@
+import pandas as pd
+
+from starchaser.datastore import DataFrameClimbStore
+from starchaser.logbook import Logbook, normalize_name
+from starchaser.utils import get_logbook_matches
+
+CLIMBS = pd.DataFrame({
+    'name': ['Redders', 'Dolce Vita', 'Dolce vita', 'Ñu Crack', 'Ghost Kitchen', None],
+    'url': ['redders', 'dolce_vita-1', 'dolce_vita-2', 'nu_crack', 'ghost_kitchen', 'no_name'],
+    'crag': ['Las Encantadas', 'Odyssey', 'Grande Grotta', 'Odyssey', 'Grande Grotta', 'Odyssey'],
+    'grade': ['6b', '6a', '6a+', '7a', '6c', '6a'],
+    'stars': [2, 1, 0, 3, 1, 0],
+})
+
+
+def matched_urls(logbook, climbs=CLIMBS):
+    mask = logbook.match(climbs['name'].map(normalize_name), climbs['crag'].map(normalize_name))
+    return climbs.loc[mask, 'url'].tolist()
+
+
+def test_normalize_name():
+    assert normalize_name("  Dolce-Vita!  ") == 'dolce vita'
+    assert normalize_name('ÑU  crack') == 'nu crack'
+    assert normalize_name('Grande_Grotta') == 'grande grotta'
+    assert normalize_name(float('nan')) == ''
+
+
+def test_match_by_name():
+    logbook = Logbook(pd.DataFrame({'Name': ['redders', 'DOLCE VITA.', 'Nu Crack', 'Unknown', None]}))
+    assert matched_urls(logbook) == ['redders', 'dolce_vita-1', 'dolce_vita-2', 'nu_crack']
+
+
+def test_match_by_name_and_crag():
+    logbook = Logbook(pd.DataFrame({
+        'Name': ['Dolce Vita', 'Redders', 'Ghost Kitchen'],
+        'Crag name': ['Grande Grotta', None, 'Kalymnos - Grande Grotta'],
+    }))
+    # The crag tells the Dolce Vitas apart, a missing crag or one named differently falls back to the name
+    assert matched_urls(logbook) == ['redders', 'dolce_vita-2', 'ghost_kitchen']
+
+
+def test_read():
+    content = b'Name,Grade,Crag\nredders,6b,Las Encantadas\n'
+    logbook = Logbook.read(content)
+    assert logbook.digest == Logbook.content_digest(content)
+    assert logbook.n_logs == 1
+    assert matched_urls(logbook) == ['redders']
+
+
+def test_matches_cached_per_area_data():
+    loaded = {'kalymnos': CLIMBS}
+    store = DataFrameClimbStore(lambda area: loaded[area])
+    logbook = Logbook(pd.DataFrame({'Name': ['Redders', 'Ghost Kitchen']}), 'digest')
+    matches = get_logbook_matches(store, 'kalymnos', logbook)
+    assert store.climbs('kalymnos').loc[matches, 'url'].tolist() == ['redders', 'ghost_kitchen']
+    assert get_logbook_matches(store, 'kalymnos', logbook) is matches
+
+    # Filtered climbs are matched by row id
+    climbs = store.climbs('kalymnos', crags=['Grande Grotta'])
+    assert climbs.loc[climbs.index.isin(matches), 'url'].tolist() == ['ghost_kitchen']
+
+    loaded['kalymnos'] = CLIMBS.head(2)
+    assert get_logbook_matches(store, 'kalymnos', logbook).tolist() == [0]
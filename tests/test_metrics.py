@@ -0,0 +1,42 @@
+import json
+import re
+
+from scrape.metrics import LatencyHistogram, ScrapeMetrics, STAGES
+
+
+def test_latency_histogram():
+    histogram = LatencyHistogram(buckets=(0.1, 1.0))
+    for seconds in [0.05, 0.1, 0.5, 3.0]:
+        histogram.add(seconds)
+    assert histogram.to_dict() == {'n': 4, 'mean': 0.9125, 'max': 3.0,
+                                   'buckets': {'<=0.1': 2, '<=1.0': 1, '>1.0': 1}}
+
+
+def test_report(tmp_path):
+    metrics = ScrapeMetrics({re.compile(r'/crags/[^/]+/[^/]+'): 'climb', re.compile(r'/crags/'): 'crag'})
+    metrics.add_request('http://ukc/crags/crag-1/', 0.2, 200, wait=0.5)
+    metrics.add_request('http://ukc/crags/crag-1/climb-2', 0.01, 503)
+    metrics.add_request('http://ukc/crags/crag-1/climb-2', 0.03, None, wait=0.25)
+    metrics.count('downloaded', n_bytes=1000)
+    metrics.count('cached', n_bytes=200)
+    metrics.count('climbs_written', 20)
+    metrics.add_failed_page('http://ukc/crags/crag-1/climb-2', 'No grade poll found')
+    with metrics.stage('parse'):
+        pass
+    metrics.add_stage_time('parse', 1.5)
+
+    metrics.write_report(str(tmp_path / 'report.json'), area='dorset')
+    with open(tmp_path / 'report.json') as f:
+        report = json.load(f)
+    assert list(report['stages']) == list(STAGES)
+    assert report['stages']['parse']['calls'] == 2
+    assert 1.5 <= report['stages']['parse']['seconds'] < 2
+    assert report['counts'] == {'downloaded': 1, 'cached': 1, 'climbs_written': 20, 'parse_failed': 1}
+    assert report['bytes'] == {'downloaded': 1000, 'cached': 200}
+    assert report['requests']['n'] == 3
+    assert report['requests']['status_codes'] == {'200': 1, '503': 1, 'error': 1}
+    assert report['requests']['latency']['climb']['n'] == 2
+    assert report['requests']['latency']['crag']['buckets']['<=0.25'] == 1
+    assert report['requests']['limiter_wait_seconds'] == 0.75
+    assert report['failed_pages'] == [{'url': 'http://ukc/crags/crag-1/climb-2', 'reason': 'No grade poll found'}]
+    assert report['area'] == 'dorset'
@@ -0,0 +1,67 @@
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from scrape.output import CLIMB_SCHEMA, OUTPUT_FORMATS
+from scrape.scrape import Scraper
+from starchaser.utils import read_climbs
+
+GUIDEBOOK_PATH = '/logbook/books/test_guide-1/'
+DICTIONARY_COLUMNS = ['grade', 'crag', 'rocktype', 'aspect']
+
+
+@pytest.fixture
+def crags(tmp_path, ukc_server):
+    return Scraper(data_dir=str(tmp_path)).scrape_guidebook_and_contents(ukc_server.url + GUIDEBOOK_PATH)
+
+
+@pytest.mark.parametrize('fmt', ['parquet', 'feather'])
+def test_columnar_output_matches_csv(tmp_path, crags, fmt):
+    s = Scraper(data_dir=str(tmp_path))
+    s.write_climbs(crags, 'climbs.csv')
+    s.write_climbs(crags, f'climbs.{fmt}', fmt)
+    assert not (tmp_path / f'climbs.{fmt}.tmp').exists()
+
+    df = read_climbs(str(tmp_path / f'climbs.{fmt}'))
+    assert list(df.columns) == CLIMB_SCHEMA.names
+    for column in DICTIONARY_COLUMNS:
+        assert isinstance(df[column].dtype, pd.CategoricalDtype)
+    assert df['stars'].dtype == 'int8'
+    assert df['logs'].dtype == 'int32'
+    assert df['poll_diff'].dtype == 'float64'
+
+    assert df.to_csv(index=False) == (tmp_path / 'climbs.csv').read_text()
+
+
+def test_parquet_row_group_per_batch(tmp_path, crags, monkeypatch):
+    monkeypatch.setattr('scrape.scrape.FLATTEN_BATCH_CLIMBS', 1)
+    Scraper(data_dir=str(tmp_path)).write_climbs(crags, 'climbs.parquet', 'parquet')
+    assert pq.ParquetFile(tmp_path / 'climbs.parquet').num_row_groups == len(crags)
+
+
+@pytest.mark.parametrize('fmt', OUTPUT_FORMATS)
+def test_read_climbs_columns(tmp_path, crags, fmt):
+    Scraper(data_dir=str(tmp_path)).write_climbs(crags, f'climbs.{fmt}', fmt)
+    df = read_climbs(str(tmp_path / f'climbs.{fmt}'), columns=['name', 'grade'])
+    assert list(df.columns) == ['name', 'grade']
+    assert len(df) == sum(len(crag.climbs) for crag in crags)
+
+
+@pytest.mark.parametrize('fmt', OUTPUT_FORMATS)
+def test_no_climbs(tmp_path, fmt):
+    Scraper(data_dir=str(tmp_path)).write_climbs([], f'climbs.{fmt}', fmt)
+    df = read_climbs(str(tmp_path / f'climbs.{fmt}'))
+    assert list(df.columns) == CLIMB_SCHEMA.names
+    assert df.empty
+
+
+@pytest.mark.parametrize('fmt', OUTPUT_FORMATS)
+def test_interrupted_write(tmp_path, crags, fmt):
+    def interrupted():
+        yield crags[0]
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        Scraper(data_dir=str(tmp_path)).write_climbs(interrupted(), f'climbs.{fmt}', fmt)
+    assert not (tmp_path / f'climbs.{fmt}').exists()
+    assert not (tmp_path / f'climbs.{fmt}.tmp').exists()
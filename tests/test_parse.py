@@ -0,0 +1,164 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+import random
+import re
+
+from bs4 import BeautifulSoup as bs
+from io import StringIO
+from pathlib import Path
+from scrape.parse import (html_to_text, parse_crag, parse_crag_soup, parse_grade_poll, parse_grade_poll_soup,
+                          parse_guidebook)
+from scrape.scrape import Scraper
+
+CRAG_DIR = Path(__file__).parent / 'data' / 'ukc' / 'logbook' / 'crags' / 'las_encantadas-2485'
+BOOKS_DIR = Path(__file__).parent / 'data' / 'ukc' / 'logbook' / 'books'
+
+
+def test_parse_grade_poll():
+    poll_data = parse_grade_poll((CRAG_DIR / 'redders-112975.html').read_bytes())
+    assert poll_data == {
+        '37hard,High 6b+': 0,
+        '37,Mid 6b+': 1,
+        '37easy,Low 6b+': 0,
+        '36hard,High 6b': 0,
+        '36,Mid 6b': 3,
+        '36easy,Low 6b': 1,
+        '35hard,High 6a+': 1,
+        '35,Mid 6a+': 0,
+        '35easy,Low 6a+': 0
+    }
+
+
+def test_parse_in_process_pool(tmp_path):
+    pages = [(p.name, p.read_bytes()) for p in sorted(CRAG_DIR.glob('*-*.html'))]
+    s = Scraper(data_dir=str(tmp_path), parse_workers=2)
+    assert list(s._parse(parse_grade_poll, pages)) == [parse_grade_poll(content) for _, content in pages]
+
+    # Each page's parse is timed in the worker that parsed it
+    assert s.metrics.stage_calls['parse'] == len(pages)
+    assert s.metrics.stage_seconds['parse'] > 0
+
+    # Later parses share the workers, until they're shut down
+    pool = s.parse_pool
+    list(s._parse(parse_crag, [('crag', (CRAG_DIR / 'index.html').read_bytes())]))
+    assert s.parse_pool is pool
+    s.close()
+    assert s.parse_pool is None
+
+
+@pytest.mark.parametrize('page', sorted(CRAG_DIR.glob('*-*.html')), ids=lambda p: p.name)
+def test_parse_grade_poll_matches_soup(page):
+    content = page.read_bytes()
+    assert parse_grade_poll(content) == parse_grade_poll_soup(content)
+
+
+@pytest.mark.parametrize('content', [
+    b'',
+    b'<div class="col-4  small text-right"> High 6a </div>',
+    b'<div class="progress-bar bg-success polltype1  progress-bar-striped" data-val="36" data-n="2"></div>'
+    b'<div class="col-4 small text-right"><span>Mid</span> 6a</div>',
+])
+def test_parse_grade_poll_edge_cases_match_soup(content):
+    assert parse_grade_poll(content) == parse_grade_poll_soup(content)
+
+
+def test_parse_crag():
+    crag = parse_crag((CRAG_DIR / 'index.html').read_bytes())
+    assert [climb['slug'] for climb in crag['climbs']] == [
+        'redders-112975', 'fat_tufa-112976', 'angel_dust-112977', 'new_route-112978', 'crack_of_gloom-112979'
+    ]
+    assert crag['grade_list']['3']['36'] == {'name': '6b', 'score': 12}
+    assert crag['buttress_data']['501']['meta']['approach_time'] == 15
+    assert crag['climb_symbols']['4']['name'] == 'Tufas'
+
+
+def test_parse_crag_matches_soup():
+    content = (CRAG_DIR / 'index.html').read_bytes()
+    assert parse_crag(content) == parse_crag_soup(content)
+
+
+def test_parse_crag_reformatted_script():
+    content = (CRAG_DIR / 'index.html').read_bytes()
+    expected = parse_crag(content)
+
+    # Spread each variable's JSON over several lines and declare them in a different order with separate lets
+    declarations = dict(re.findall(r'(\w+) = (.*)[,;]\n', content.decode()))
+    script = '\n'.join(f'let {key} =\n{json.dumps(json.loads(value), indent=2)};'
+                        for key, value in reversed(declarations.items()))
+    reformatted = re.sub(r'let cragId.*?;\n', lambda _: f'let cragId = 2485;\n{script}\n', content.decode(), flags=re.S)
+
+    assert parse_crag(reformatted.encode()) == expected
+
+
+def test_html_to_text_matches_soup():
+    fragments = [climb['desc'] for climb in parse_crag((CRAG_DIR / 'index.html').read_bytes())['climbs']] + [
+        '',
+        'plain text',
+        '<p><strong>UKClimbing Description</strong></p><p>Steep &amp; pumpy<br>to the chains.</p>',
+        '<p>a</p> <p>b</p>\n<p>c</p>',
+        '</p>  leading space',
+        '<p>x</p><!-- comment -->y<script>var z;</script><style>p {}</style>',
+        '<pre>  keep \n  spaces </pre>',
+        '<p class="x">Unknown &foo; &lt;tag&gt; & <unclosed',
+        'line\r\nbreak',
+        '\ufeffSteep',
+        '\ufeff<p>Steep</p>',
+        '\ufeff\ufeff \ufeffSteep',
+    ]
+    assert html_to_text(fragments) == [bs(fragment, 'lxml').get_text() for fragment in fragments]
+
+
+# Pieces of HTML that random fragments are made from: text, entities and inline tags that html_to_text converts without
+# a parser, then markup that lxml treats differently depending on where it appears
+SIMPLE_FUZZ_PIECES = [
+    'Steep', 'pockets', 'to the chains.', ' ', '  ', '\n', '\t', '&amp;', '&lt;', '&gt;', '&quot;', '&nbsp;',
+    '<p>', '</p>', '<b>', '</b>', '<i>', '</i>', '<em>', '</em>', '<strong>', '</strong>', '<sup>', '</sup>', '<br>',
+    '<br/>', '<br />', '<p class="x">', '<a href="/logbook/crags/x?a=1&amp;b=2">', '</a>', "<span class='y' hidden>",
+    '</span>', '\ufeff', '\xa0', '\x85', '\u2028', '\u3000',
+]
+FUZZ_PIECES = SIMPLE_FUZZ_PIECES + [
+    '\r\n', '\x0c', '\x01', '&#39;', '&#x2014;', '&copy;', '&foo;', '&', '<div>', '</div>', '<ul>', '<li>', '</ul>',
+    '<table>', '<td>', '</table>', '<pre>', '</pre>', '<textarea>', '</textarea>', '<script>', '</script>', '<style>',
+    '</style>', '<title>', '<head>', '<body>', '<html>', '<!-- comment -->', '<!DOCTYPE html>', '<?xml x?>', '<', '>',
+    '<p', '<a href="x>', '<img src="x.png">', '<P>', '<BR>',
+]
+
+
+@pytest.mark.filterwarnings('ignore::bs4.XMLParsedAsHTMLWarning')
+@pytest.mark.parametrize('pieces', [SIMPLE_FUZZ_PIECES, FUZZ_PIECES])
+def test_html_to_text_matches_soup_fuzzed(pieces):
+    rng = random.Random(0)
+    fragments = [''.join(rng.choices(pieces, k=rng.randint(0, 12))) for _ in range(5000)]
+    for fragment, text in zip(fragments, html_to_text(fragments)):
+        assert text == bs(fragment, 'lxml').get_text(), fragment
+
+
+def parse_guidebook_read_html(content, skip_tables=0):
+    """The original guidebook parsing with pandas.read_html, skipping tables that aren't crag tables"""
+    tables = pd.read_html(StringIO(content.decode('utf-8', errors='replace')), extract_links='all')[skip_tables:]
+    df_crags = pd.DataFrame(np.vstack(tables), columns=['crag', 'nclimbs', 'rocktype', 'aspect'])
+    df_crags['name'] = df_crags['crag'].apply(pd.Series)[0]
+    df_crags['href'] = df_crags['crag'].apply(pd.Series)[1]
+    df_crags = df_crags.dropna()
+    df_crags['nclimbs'] = df_crags['nclimbs'].apply(pd.Series)[0].apply(int)
+    df_crags['rocktype'] = df_crags['rocktype'].apply(pd.Series)[0]
+    df_crags['aspect'] = df_crags['aspect'].apply(pd.Series)[0]
+    return df_crags[['name', 'nclimbs', 'rocktype', 'aspect', 'href']].to_dict(orient='records')
+
+
+@pytest.mark.parametrize('guidebook, skip_tables', [('test_guide-1', 0), ('multi_table_guide-3', 1)])
+def test_parse_guidebook_matches_read_html(guidebook, skip_tables):
+    content = (BOOKS_DIR / guidebook / 'index.html').read_bytes()
+    assert parse_guidebook(content) == parse_guidebook_read_html(content, skip_tables)
+
+
+def test_parse_guidebook_multiple_tables():
+    crags = parse_guidebook((BOOKS_DIR / 'multi_table_guide-3' / 'index.html').read_bytes())
+    assert crags == [
+        {'name': 'Las Encantadas', 'nclimbs': 5, 'rocktype': 'Limestone', 'aspect': 'W',
+         'href': '/logbook/crags/las_encantadas-2485'},
+        {'name': 'Odyssey new', 'nclimbs': 2, 'rocktype': 'Limestone', 'aspect': 'SE',
+         'href': '/logbook/crags/odyssey-2490'},
+    ]
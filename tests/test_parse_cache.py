@@ -0,0 +1,37 @@
+import sqlite3
+
+from scrape.parse_cache import ParseCache
+
+
+def test_reused_while_unchanged(tmp_path):
+    cache = ParseCache(str(tmp_path / 'parsed.sqlite'), 'v1')
+    digest = cache.digest(b'<html>')
+    cache.set('parse_crag', 'url', digest, {'climbs': []})
+    assert cache.get('parse_crag', 'url', digest) == (True, {'climbs': []})
+    assert cache.get('parse_crag', 'url', cache.digest(b'<html>changed')) == (False, None)
+    assert cache.get('parse_grade_poll', 'url', digest) == (False, None)
+
+
+def test_other_parser_version_not_reused(tmp_path):
+    db_path = str(tmp_path / 'parsed.sqlite')
+    cache = ParseCache(db_path, 'v1')
+    digest = cache.digest(b'<html>')
+    cache.set('parse_crag', 'url', digest, {'climbs': []})
+
+    cache = ParseCache(db_path, 'v2')
+    assert cache.get('parse_crag', 'url', digest) == (False, None)
+    assert cache.connection.execute('SELECT COUNT(*) FROM parsed').fetchone()[0] == 0
+
+
+def test_unversioned_results_dropped(tmp_path):
+    db_path = str(tmp_path / 'parsed.sqlite')
+    with sqlite3.connect(db_path) as connection:
+        connection.execute('CREATE TABLE parsed (parser TEXT, url TEXT, digest BLOB, result BLOB, '
+                           'PRIMARY KEY (parser, url))')
+        connection.execute('INSERT INTO parsed VALUES (?, ?, ?, ?)', ('parse_crag', 'url', b'digest', b'result'))
+    connection.close()
+
+    cache = ParseCache(db_path, 'v1')
+    assert cache.get('parse_crag', 'url', b'digest') == (False, None)
+    cache.set('parse_crag', 'url', b'digest', None)
+    assert cache.get('parse_crag', 'url', b'digest') == (True, None)
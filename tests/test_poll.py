@@ -1,4 +1,7 @@
-from scrape.grade_poll import get_poll_grade
+import numpy as np
+import random
+
+from scrape.grade_poll import get_poll_diffs, get_poll_grade, get_poll_grades, poll_matrix
 from math import isclose
 
 
@@ -33,3 +36,34 @@ def test_get_poll_grade_no_votes():
     assert grade_text == 'No votes'
     assert grade_code == 'No votes'
     assert isclose(score_modifier, 0.0, abs_tol=1e-6)
+
+
+def random_poll(width):
+    poll_data = {}
+    for code in range(36 + width // 3, 36 - width // 3 - 1, -1):
+        for suffix, modifier in (('hard', 'High'), ('', 'Mid'), ('easy', 'Low')):
+            poll_data[f'{code}{suffix},{modifier} {code}'] = random.choice([0, 0, 1, 2, 5])
+    return dict(list(poll_data.items())[:width])
+
+
+def test_get_poll_grades_matches_scalar():
+    random.seed(0)
+    polls = [random_poll(random.randint(0, 12)) for _ in range(2000)]
+    polls += [
+        {'36,Mid 6b': 0},
+        {'37,Mid 6b+': 1, '36,Mid 6b': 1},  # Weighted mean index of 1.5 rounds to even
+        {'37,Mid 6b+': 1, '36,Mid 6b': 0, '35,Mid 6a+': 0, '34,Mid 6a': 1},  # 2.5
+    ]
+
+    grade_text, grade_code, grade_modifier = get_poll_grades(*poll_matrix(polls))
+    assert list(zip(grade_text, grade_code, grade_modifier)) == [get_poll_grade(poll_data) for poll_data in polls]
+
+
+def test_get_poll_grades_empty():
+    grade_text, grade_code, grade_modifier = get_poll_grades(*poll_matrix([]))
+    assert len(grade_text) == len(grade_code) == len(grade_modifier) == 0
+
+
+def test_get_poll_diffs():
+    poll_diffs = get_poll_diffs([12, 12, 12], [10, 12, np.nan], [0.33, 0.0, 0.0])
+    assert poll_diffs.tolist() == [12 - (10 + 0.33), 0.0, -0.01]
@@ -0,0 +1,35 @@
+from pathlib import Path
+from scrape.parse import parse_crag
+from scrape.records import Climb, Crag
+
+CRAG_PAGE = Path(__file__).parent / 'data' / 'ukc' / 'logbook' / 'crags' / 'las_encantadas-2485' / 'index.html'
+CRAG_INFO = {'name': 'Las Encantadas', 'url': 'https://www.ukclimbing.com/logbook/crags/las_encantadas-2485/',
+             'id': 2485, 'nclimbs': 10, 'rocktype': 'Limestone', 'aspect': 'W'}
+
+
+def test_climb_from_table_data():
+    climb = Climb.from_table_data({'name': 'Redders', 'slug': 'redders-112975', 'grade': '36', 'gradetype': '3',
+                                   'stars': '2', 'logs': '17', 'buttress_id': 501, 'desc': None, 'symbols': None,
+                                   'height': 25, 'first_ascent': None})
+    assert climb == Climb('Redders', 'redders-112975', 36, 3, 2, 17, 501, '', [], None, None, None)
+    assert not hasattr(climb, '__dict__')
+
+
+def test_crag_from_page():
+    crag_data = parse_crag(CRAG_PAGE.read_bytes())
+    crag = Crag.from_page(CRAG_INFO, crag_data, {3})
+    assert crag.name == 'Las Encantadas'
+    assert [climb.slug for climb in crag.climbs] == [climb['slug'] for climb in crag_data['climbs']
+                                                     if climb['gradetype'] == 3]
+
+    for buttress_id, buttress in crag_data['buttress_data'].items():
+        assert crag.buttresses[buttress_id] == (buttress['name'], buttress['meta'].get('approach_time', 0))
+    assert crag.symbols == {symbol_id: symbol['name'] for symbol_id, symbol in crag_data['climb_symbols'].items()}
+
+    assert Crag.from_page(CRAG_INFO, crag_data, {99}).climbs == []
+    assert Crag.from_page(CRAG_INFO, dict(crag_data, buttress_data=None, climb_symbols=None), {3}).buttresses == {}
+
+    buttress_data = {'501': {'name': 'Main Wall', 'meta': []}, '502': {'name': 'Cave'},
+                     '503': {'name': 'Slab', 'meta': {'approach_time': 15}}}
+    assert Crag.from_page(CRAG_INFO, dict(crag_data, buttress_data=buttress_data), {3}).buttresses == {
+        '501': ('Main Wall', 0), '502': ('Cave', 0), '503': ('Slab', 15)}
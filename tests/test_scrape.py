@@ -1,10 +1,325 @@
-from scrape.scrape import Scraper
+import copy
+import pandas as pd
+import pytest
+import requests
+import time
+
+from bs4 import BeautifulSoup as bs
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from requests_cache.policy.expiration import get_url_expiration
+from pathlib import Path
+from requests import ConnectionError
+from scrape.block_network import block_network
+from scrape.grades import GradeIndex
+from scrape.journal import Journal
+from scrape.limiter import AdaptiveRateLimiter
+from scrape.parse import parse_crag
+from scrape.records import Crag
+from scrape.scrape import Scraper, URLS_EXPIRE_AFTER
 from scrape.grade_poll import get_poll_grade
+from tests.corpus import SyntheticCorpus
+from tests.server import UKCServer
+
+CLIMB_PATH = '/logbook/crags/las_encantadas-2485/redders-112975'
+GUIDEBOOK_PATH = '/logbook/books/test_guide-1/'
+CRAGS_DIR = Path(__file__).parent / 'data' / 'ukc' / 'logbook' / 'crags'
+
+
+def test_scrape(tmp_path, ukc_server):
+    s = Scraper(data_dir=str(tmp_path))
+    poll_data = s.scrape_grade_poll(ukc_server.url + CLIMB_PATH, refresh=False)
+    assert poll_data['36,Mid 6b'] == 3
+    assert sum(poll_data.values()) == 6
+    assert get_poll_grade(poll_data) == ('Mid 6b', '36', 0.0)
+
+
+def test_failed_polls_reported(tmp_path, ukc_server):
+    s = Scraper(data_dir=str(tmp_path))
+    new_route_url = ukc_server.url + '/logbook/crags/las_encantadas-2485/new_route-112978'
+    s.scrape_guidebook_and_contents(ukc_server.url + GUIDEBOOK_PATH)
+    assert not s.scrape_grade_poll(new_route_url, refresh=False)
+    assert s.stats['parse_failed'] == 2
+    assert s.metrics.failed_pages == [{'url': new_route_url, 'reason': 'No grade poll found'}] * 2
+
+
+def test_offline(tmp_path, ukc_server):
+    crag_list = Scraper(data_dir=str(tmp_path)).scrape_guidebook_and_contents(ukc_server.url + GUIDEBOOK_PATH)
+    n_requests = len(ukc_server.requests)
+
+    # Cached pages are served even once they have expired, and nothing is requested
+    s = Scraper(data_dir=str(tmp_path), offline=True)
+    with block_network():
+        assert s.scrape_guidebook_and_contents(ukc_server.url + GUIDEBOOK_PATH, refresh=True) == crag_list
+        with pytest.raises(ConnectionError):
+            s.fetch(ukc_server.url + '/logbook/books/multi_table_guide-3/', refresh=False)
+    assert len(ukc_server.requests) == n_requests
+
+
+def test_block_network(ukc_server):
+    with block_network(), pytest.raises(Exception, match='Network call blocked'):
+        requests.get(ukc_server.url + CLIMB_PATH)
+    assert requests.get(ukc_server.url + CLIMB_PATH).ok
+
+
+def test_slow_unreliable_server(tmp_path):
+    corpus = SyntheticCorpus(n_crags=3, n_climbs=4)
+    with UKCServer(corpus=corpus) as server:
+        expected = Scraper(data_dir=str(tmp_path / 'reliable')).scrape_guidebook_and_contents(
+            server.url + '/logbook/books/bench-1/')
+    n_climbs = sum(len(crag.climbs) for crag in expected)
+    assert n_climbs > 0
+
+    # Failed requests are retried, so the scrape is the same apart from the server's url
+    limiter = AdaptiveRateLimiter(rate=1000, max_rate=1000)
+    with UKCServer(latency=0.01, error_rate=0.3, corpus=corpus) as server:
+        s = Scraper(data_dir=str(tmp_path / 'unreliable'), concurrency=4, limiter=limiter, retries=10)
+        crag_list = s.scrape_guidebook_and_contents(server.url + '/logbook/books/bench-1/')
+        assert len(server.requests) > s.stats['downloaded'] == 1 + 3 + n_climbs
+        assert s.metrics.status_codes['503'] == len(server.requests) - s.stats['downloaded']
+
+    assert (Scraper.flatten_crags(crag_list, s.grades).drop(columns='url')
+            .equals(Scraper.flatten_crags(expected, s.grades).drop(columns='url')))
+
+
+def test_concurrent_map_preserves_order(tmp_path):
+    s = Scraper(data_dir=str(tmp_path), concurrency=4)
+    assert list(s._map(lambda x: x * 2, range(20))) == [x * 2 for x in range(20)]
+
+
+def test_cache(tmp_path, ukc_server):
+    s = Scraper(data_dir=str(tmp_path))
+    url = ukc_server.url + CLIMB_PATH
+
+    content = s.fetch(url, refresh=False)
+    assert s.fetch(url, refresh=False) == content
+    assert ukc_server.requests == [CLIMB_PATH]
+    assert (tmp_path / 'ukc-cache.sqlite').exists()
+
+    assert s.fetch(url, refresh=True) == content
+    assert ukc_server.requests == [CLIMB_PATH, CLIMB_PATH]
+
+    # Pruning only expired responses leaves their parse results, clearing the cache deletes them too
+    s.parse_cache.set('parse_grade_poll', url, s.parse_cache.digest(content), None)
+    s.prune_cache()
+    assert s.parse_cache.get('parse_grade_poll', url, s.parse_cache.digest(content)) == (True, None)
+    s.prune_cache(older_than=timedelta(0))
+    assert s.session.cache.responses.count() == 0
+    assert s.parse_cache.get('parse_grade_poll', url, s.parse_cache.digest(content)) == (False, None)
+
+
+def test_prune_cache_vacuums(tmp_path):
+    corpus = SyntheticCorpus(n_crags=2, n_climbs=10)
+    s = Scraper(data_dir=str(tmp_path), concurrency=4)
+    with UKCServer(corpus=corpus) as server:
+        list(s._map(lambda path: s.fetch(server.url + path, refresh=False), corpus.climb_paths()))
+    time.sleep(0.01)
+
+    # The freed pages are returned to the filesystem rather than left on SQLite's free list
+    s.prune_cache(older_than=timedelta(microseconds=1))
+    assert s.session.cache.responses.count() == 0
+    with s.session.cache.responses.connection() as con:
+        assert con.execute('PRAGMA freelist_count').fetchone()[0] == 0
+
+
+def test_cache_expiry():
+    base_url = 'https://www.ukclimbing.com/logbook'
+    assert get_url_expiration(f'{base_url}/books/dorset-2348/', URLS_EXPIRE_AFTER) == timedelta(days=1)
+    assert get_url_expiration(f'{base_url}/crags/las_encantadas-2485/', URLS_EXPIRE_AFTER) == timedelta(days=7)
+    assert get_url_expiration(f'{base_url}{CLIMB_PATH[len("/logbook"):]}', URLS_EXPIRE_AFTER) == timedelta(days=30)
+
+
+def test_revalidate(tmp_path, ukc_server):
+    crag_list = Scraper(data_dir=str(tmp_path)).scrape_guidebook_and_contents(ukc_server.url + GUIDEBOOK_PATH)
+    n_pages = len(ukc_server.requests)
+
+    s = Scraper(data_dir=str(tmp_path), revalidate=True)
+    assert s.scrape_guidebook_and_contents(ukc_server.url + GUIDEBOOK_PATH) == crag_list
+    assert len(ukc_server.requests) == 2 * n_pages
+    assert s.stats['unchanged'] == n_pages
+    assert s.stats['downloaded'] == 0
+    # Every crag and climb page is unchanged so none are parsed again
+    assert s.stats['parse_reused'] == n_pages - 1
+
+
+def test_incremental(tmp_path, ukc_server):
+    s = Scraper(data_dir=str(tmp_path))
+    crag_list = s.scrape_guidebook_and_contents(ukc_server.url + GUIDEBOOK_PATH)
+    s.write_climb_state({url: climb for crag in crag_list for url, climb in s.get_climb_state(crag).items()},
+                        'state.json')
+    previous_state = s.read_climb_state('state.json')
+
+    # Pretend the previous run saw fewer logs on one climb and didn't see another at all
+    changed_url = crag_list[0].climbs[0].url
+    new_url = crag_list[1].climbs[0].url
+    previous_state[changed_url]['logs'] -= 1
+    del previous_state[new_url]
+    bad_poll_urls = [url for url, climb in previous_state.items() if climb['poll_grade_text'] == 'Bad poll data']
+
+    # Use an empty cache so that every page the scraper needs is requested from the server
+    s = Scraper(data_dir=str(tmp_path / 'incremental'))
+    ukc_server.requests.clear()
+    assert s.scrape_guidebook_and_contents(ukc_server.url + GUIDEBOOK_PATH, previous_state=previous_state) == crag_list
+    climb_requests = [path for path in ukc_server.requests if not path.endswith('/')]
+    assert sorted(climb_requests) == sorted(url[len(ukc_server.url):] for url in [changed_url, new_url] + bad_poll_urls)
+
+
+def test_resume_from_journal(tmp_path, ukc_server, monkeypatch):
+    guidebook_url = ukc_server.url + GUIDEBOOK_PATH
+    crag_list = Scraper(data_dir=str(tmp_path / 'uninterrupted')).scrape_guidebook_and_contents(guidebook_url)
+
+    # Kill the scrape at the fifth page fetch, after the guidebook, the first crag and two of its climbs
+    s = Scraper(data_dir=str(tmp_path))
+    fetch = s.fetch
+    n_fetches = 0
+
+    def interrupted_fetch(url, refresh):
+        nonlocal n_fetches
+        n_fetches += 1
+        if n_fetches == 5:
+            raise KeyboardInterrupt
+        return fetch(url, refresh)
+
+    monkeypatch.setattr(s, 'fetch', interrupted_fetch)
+    journal_path = str(tmp_path / 'journal.jsonl')
+    with pytest.raises(KeyboardInterrupt):
+        s.scrape_guidebook_and_contents(guidebook_url, journal=Journal(journal_path))
+
+    # Resume with an empty cache, so that every page the scraper needs is requested from the server
+    journal = Journal(journal_path)
+    assert len(journal.crags) == 1
+    assert len(journal.climbs) == 2
+
+    ukc_server.requests.clear()
+    s = Scraper(data_dir=str(tmp_path / 'resumed'))
+    assert s.scrape_guidebook_and_contents(guidebook_url, journal=journal) == crag_list
+    # The guidebook, the second crag and the remaining climbs
+    assert len(ukc_server.requests) == 1 + 1 + sum(len(crag.climbs) for crag in crag_list) - 2
+
+
+def test_scrape_areas_concurrently(tmp_path, ukc_server):
+    guidebook_url = ukc_server.url + GUIDEBOOK_PATH
+    crag_list = Scraper(data_dir=str(tmp_path / 'serial')).scrape_guidebook_and_contents(guidebook_url)
+
+    s = Scraper(data_dir=str(tmp_path), concurrency=2)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = list(executor.map(s.scrape_guidebook_and_contents, [guidebook_url] * 2))
+    assert results == [crag_list, crag_list]
+
+
+def test_stream_to_csv(tmp_path, ukc_server):
+    guidebook_url = ukc_server.url + GUIDEBOOK_PATH
+    s = Scraper(data_dir=str(tmp_path))
+    s.write_climbs_csv(s.scrape_guidebook_and_contents(guidebook_url), 'list.csv')
+    s.write_climbs_csv(s.iter_guidebook_and_contents(guidebook_url), 'stream.csv')
+    assert (tmp_path / 'stream.csv').read_text() == (tmp_path / 'list.csv').read_text()
+    assert not (tmp_path / 'stream.csv.tmp').exists()
+
+
+def test_scrape_multi_table_guidebook(tmp_path, ukc_server):
+    s = Scraper(data_dir=str(tmp_path))
+    crag_list = s.scrape_guidebook(ukc_server.url + '/logbook/books/multi_table_guide-3/', refresh=False)
+    expected = s.scrape_guidebook(ukc_server.url + GUIDEBOOK_PATH, refresh=False)
+    assert [crag['url'] for crag in crag_list] == [crag['url'] for crag in expected]
+    assert [crag['name'] for crag in crag_list] == ['Las Encantadas', 'Odyssey new']
+    # Not the 127 of the server's address
+    assert [crag['id'] for crag in expected] == [2485, 2490]
+
+
+def test_grade_types(tmp_path, ukc_server):
+    guidebook_url = ukc_server.url + GUIDEBOOK_PATH
+    sport = Scraper(data_dir=str(tmp_path)).scrape_guidebook_and_contents(guidebook_url)
+    assert {climb.gradetype for crag in sport for climb in crag.climbs} == {3}
+
+    # The grade index saved by the first run is loaded by the next
+    s = Scraper(data_dir=str(tmp_path), grade_types=['sport', '2'])
+    assert s.grades.gradetype_ids(['trad']) == {2}
+    crags = s.scrape_guidebook_and_contents(guidebook_url)
+    assert {climb.gradetype for crag in crags for climb in crag.climbs} == {2, 3}
+
+    trad_climb = next(climb for crag in crags for climb in crag.climbs if climb.gradetype == 2)
+    assert s.flatten_crags(crags, s.grades).set_index('url').loc[trad_climb.url, 'grade'] == \
+        s.grades.grade_list['2'][str(trad_climb.grade)]['name']
+
+    # A misspelt grade type fails rather than scraping nothing
+    with pytest.raises(ValueError, match='sprot'):
+        Scraper(data_dir=str(tmp_path / 'new'), grade_types=['sprot']).scrape_guidebook_and_contents(guidebook_url)
+
+
+def flatten_crags_row_by_row(crags):
+    """The original flattening, one dict per climb"""
+    list_of_climbs = list()
+    for crag in crags:
+        for climb in crag['climbs']:
+            c = dict()
+            c['name'] = climb['name']
+            c['url'] = climb['url']
+            c['grade'] = crag['grade_list'][str(climb['gradetype'])][str(climb['grade'])]['name']
+            c['stars'] = climb['stars']
+            c['logs'] = climb['logs']
+            c['poll_grade'] = climb['poll_grade_text']
+            c['poll_diff'] = climb['poll_diff']
+            c['crag'] = crag['name']
+            buttress_id_str = str(climb['buttress_id'])
+            if buttress_id_str in crag['buttress_data']:
+                c['buttress'] = crag['buttress_data'][buttress_id_str]['name']
+            c['desc'] = (bs(climb['desc'], 'lxml').get_text()
+                         .removeprefix('Rockfax Description')
+                         .removeprefix('UKClimbing Description'))
+            c['symbols'] = ', '.join([crag['climb_symbols'][str(s)]['name'] for s in climb['symbols']
+                                      if str(s) in crag['climb_symbols']])
+            c['approach_time'] = 0
+            if buttress_id_str in crag['buttress_data']:
+                if 'approach_time' in crag['buttress_data'][buttress_id_str]['meta']:
+                    c['approach_time'] = crag['buttress_data'][buttress_id_str]['meta']['approach_time']
+            c['rocktype'] = crag['rocktype']
+            c['aspect'] = crag['aspect']
+            list_of_climbs.append(c)
+    return pd.DataFrame(list_of_climbs)
+
+
+def to_records(crags):
+    """Crag records from crag dicts with every grade type, as the scraper makes them from the guidebook and crag page"""
+    records = []
+    for n, crag in enumerate(crags):
+        info = {'name': crag['name'], 'url': crag['name'], 'id': n, 'nclimbs': len(crag['climbs']),
+                'rocktype': crag['rocktype'], 'aspect': crag['aspect']}
+        record = Crag.from_page(info, crag, [int(gradetype) for gradetype in crag['grade_list']])
+        for climb, climb_data in zip(record.climbs, crag['climbs']):
+            climb.url, climb.poll_grade_text, climb.poll_diff = (climb_data['url'], climb_data['poll_grade_text'],
+                                                                 climb_data['poll_diff'])
+        records.append(record)
+    return records
+
+
+def test_flatten_crags_matches_row_by_row():
+    crags = []
+    for n, crag_dir in enumerate(sorted(CRAGS_DIR.iterdir())):
+        crag = parse_crag((crag_dir / 'index.html').read_bytes())
+        crag.update(name=crag_dir.name, rocktype='Limestone', aspect='W')
+        for climb in crag['climbs']:
+            climb.update(url=climb['slug'], poll_grade_text='Mid 6a', poll_diff=0.0)
+        crags.append(crag)
+
+    # A climb on an unknown buttress with unknown symbols, a crag without buttresses and a crag without climbs
+    crags[0]['climbs'][0].update(buttress_id=999, symbols=[1, 999])
+    crags.append(dict(copy.deepcopy(crags[0]), name='No buttresses', buttress_data={}))
+    crags.append(dict(copy.deepcopy(crags[0]), name='No climbs', climbs=[]))
+
+    grades = GradeIndex()
+    for crag in crags:
+        grades.add(crag['grade_list'])
+
+    expected = flatten_crags_row_by_row(crags)
+    flattened = Scraper.flatten_crags(to_records(crags), grades)
+    assert flattened.to_csv(index=False) == expected[flattened.columns].to_csv(index=False)
 
 
-def test_scrape():
-    s = Scraper()
-    poll_data = s.scrape_grade_poll('https://www.ukclimbing.com/logbook/crags/las_encantadas-2485/redders-112975',
-                                    refresh=False)
-    poll_grade_text, poll_grade_code, score_modifier = get_poll_grade(poll_data)
-    assert True
\ No newline at end of file
+def test_flatten_crags_unknown_grade():
+    crag = parse_crag((CRAGS_DIR / 'las_encantadas-2485' / 'index.html').read_bytes())
+    crag.update(name='Las Encantadas', rocktype='Limestone', aspect='W')
+    for climb in crag['climbs']:
+        climb.update(url=climb['slug'], poll_grade_text='Mid 6a', poll_diff=0.0)
+    crag['climbs'][0]['grade'] = 999
+    with pytest.raises(KeyError):
+        Scraper.flatten_crags(to_records([crag]), GradeIndex(crag['grade_list']))
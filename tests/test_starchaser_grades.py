@@ -0,0 +1,17 @@
+from starchaser.grades import grade_sort_key
+
+
+def test_grade_sort_key():
+
+    grade_list = [
+        'V10', 'E1 5b', '6a+', 'project', 'f7A', 'HVS 5a', '9c+', 'V2', 'VS 4c', 'E10 7a', 'f6A+', '6a', 'VB', 'S 4a',
+        'VS 4b', '4', '7b', 'M', 'V0',
+    ]
+
+    assert sorted(grade_list, key=grade_sort_key) == [
+        '4', '6a', '6a+', '7b', '9c+',
+        'f6A+', 'f7A',
+        'M', 'S 4a', 'VS 4b', 'VS 4c', 'HVS 5a', 'E1 5b', 'E10 7a',
+        'VB', 'V0', 'V2', 'V10',
+        'project',
+    ]